@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from compressed_io import open_file
+from profiler import peak_memory_mb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Shipped corpora per language: the gold CoNLL file, its tsv source and a file with fixes for replace_sentences
+CORPORA = {
+    "de": {
+        "conll": os.path.join(REPO_DIR, "german", "gold", "german_amb_gold.conll"),
+        "tsv": os.path.join(REPO_DIR, "german", "gold", "german_amb_gold.tsv"),
+        "fixes": os.path.join(REPO_DIR, "german", "gold", "german_amb_gold_all-heads.conll"),
+    },
+    "nl": {
+        "conll": os.path.join(REPO_DIR, "dutch", "gold", "dutch_amb_gold.conll"),
+        "tsv": os.path.join(REPO_DIR, "dutch", "gold", "dutch_amb_gold.tsv"),
+        "fixes": os.path.join(REPO_DIR, "dutch", "gold", "dutch_amb_gold_all-heads.conll"),
+    },
+}
+
+
+def bench_read_conll_file(paths, output_path):
+    from conll2conll_fixer import read_conll_file
+    read_conll_file(paths["conll"])
+
+
+def bench_process_single_file(paths, output_path):
+    from conll_checker import process_single_file
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        process_single_file(paths["conll"])
+
+
+def bench_conll2tsv(paths, output_path):
+    from conversions import conll2tsv
+    conll2tsv(paths["conll"], output_path)
+
+
+def bench_tsv2conll(paths, output_path):
+    from conversions import tsv2conll
+    tsv2conll(paths["tsv"], output_path, "conll", paths["language"])
+
+
+def bench_conll2conllu(paths, output_path):
+    from conversions import conll2conllu
+    conll2conllu(paths["conll"], output_path)
+
+
+def bench_replace_sentences(paths, output_path):
+    from conll2conll_fixer import replace_sentences
+    replace_sentences(paths["conll"], paths["fixes"], output_path)
+
+
+BENCHMARKS = {
+    "read_conll_file": bench_read_conll_file,
+    "process_single_file": bench_process_single_file,
+    "conll2tsv": bench_conll2tsv,
+    "tsv2conll": bench_tsv2conll,
+    "conll2conllu": bench_conll2conllu,
+    "replace_sentences": bench_replace_sentences,
+}
+
+
+def make_synthetic(paths, scale, work_dir):
+    """Write a corpus that repeats the shipped CoNLL and tsv files scale times (the fixes file is kept as is)."""
+    if scale == 1:
+        return dict(paths)
+    synthetic = dict(paths)
+    for kind in ["conll", "tsv"]:
+        target = os.path.join(work_dir, f"{paths['language']}_x{scale}_{os.path.basename(paths[kind])}")
+        with open_file(paths[kind], "rb") as f_in:
+            data = f_in.read()
+        if kind == "tsv":
+            header, _, data = data.partition(b"\n")
+            header += b"\n"
+        else:
+            header = b""
+            if not data.endswith(b"\n\n"):
+                data = data.rstrip(b"\r\n") + b"\n\n"
+        with open_file(target, "wb") as f_out:
+            f_out.write(header)
+            for _ in range(scale):
+                f_out.write(data)
+        synthetic[kind] = target
+    return synthetic
+
+
+def _run_in_child(name, paths, output_path, repeat, queue):
+    start_rss = peak_memory_mb()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BENCHMARKS[name](paths, output_path)
+        times.append(time.perf_counter() - start)
+    queue.put({"seconds": min(times), "peak_rss_mb": round(peak_memory_mb(), 1),
+               "peak_rss_delta_mb": round(peak_memory_mb() - start_rss, 1)})
+
+
+def run_benchmark(name, paths, output_path, repeat=1):
+    """
+    Run a benchmark in a fresh process, so that its peak memory is measured in isolation, and return its best
+    time over repeat runs and its peak resident memory. A crashing (e.g. out of memory) run is recorded as an error.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_in_child, args=(name, paths, output_path, repeat, queue))
+    process.start()
+    process.join()
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    if process.exitcode != 0:
+        return {"error": f"exit code {process.exitcode}"}
+    result = queue.get()
+    result["seconds"] = round(result["seconds"], 4)
+    return result
+
+
+def run_suite(benchmarks, languages, scales, repeat=1, work_dir=None):
+    """Run the given benchmarks on all languages and scales and return a results dict keyed 'name/language/xscale'."""
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="sorts_bench_")
+    results = {}
+    try:
+        for language in languages:
+            paths = dict(CORPORA[language], language=language)
+            for scale in scales:
+                corpus = make_synthetic(paths, scale, work_dir)
+                for name in benchmarks:
+                    key = f"{name}/{language}/x{scale}"
+                    results[key] = run_benchmark(name, corpus, os.path.join(work_dir, "output"), repeat)
+                    print(key, json.dumps(results[key]), file=sys.stderr)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(baseline, results, threshold):
+    """
+    Return a list of (key, metric, old, new) regressions: runs that became more than threshold (a fraction) slower
+    or needed more than threshold more memory than in the baseline, and runs that no longer finish.
+    """
+    regressions = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None or "error" in old:
+            continue
+        if "error" in new:
+            regressions.append((key, "error", None, new["error"]))
+            continue
+        for metric in ["seconds", "peak_rss_mb"]:
+            if new[metric] > old[metric] * (1 + threshold):
+                regressions.append((key, metric, old[metric], new[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Time and measure the peak memory of the main scripts.")
+    argparser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    argparser.add_argument("--languages", nargs="+", choices=list(CORPORA), default=list(CORPORA))
+    argparser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100],
+                           help="Sizes of the synthetic corpora, in copies of the shipped files.")
+    argparser.add_argument("--repeat", type=int, default=1, help="Report the best time of this many runs.")
+    argparser.add_argument("--output", "-o", type=str, default=None, help="Write the results as a JSON baseline.")
+    argparser.add_argument("--compare", type=str, default=None, metavar="BASELINE",
+                           help="Compare against a JSON baseline and exit with status 1 on regressions.")
+    argparser.add_argument("--threshold", type=float, default=0.2,
+                           help="Relative slowdown or memory growth counted as a regression (default: 0.2).")
+    argparser.add_argument("--work-dir", type=str, default=None,
+                           help="Folder for the synthetic corpora and outputs (default: a temporary folder).")
+    args = argparser.parse_args()
+
+    results = run_suite(args.benchmarks, args.languages, args.scales, args.repeat, args.work_dir)
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for key, metric, old, new in regressions:
+            print(f"[REGRESSION] {key}: {metric} {old} -> {new}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+
+from corpus_cache import CACHE_DIRNAME
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(filename):
+    """Return the path of the check manifest of a file: <dir>/.sorts_cache/<basename>.check.json"""
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIRNAME, basename + ".check.json")
+
+
+def sentence_fingerprint(sentence):
+    """Return a stable hash of the text of a sentence (comments and token lines)."""
+    return hashlib.blake2b("\n".join(sentence.lines()).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def load_manifest(filename, ruleset):
+    """
+    Return the cached check results of a file as a dict fingerprint -> (errors, mismatches), together with the
+    column count they were produced for. Results produced by another rule set are discarded.
+    """
+    try:
+        with open(manifest_path(filename), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, None
+
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("ruleset") != ruleset:
+        return {}, None
+
+    results = {fingerprint: ([tuple(e) for e in errors], [tuple(m) for m in mismatches])
+               for fingerprint, (errors, mismatches) in manifest["sentences"].items()}
+    return results, manifest.get("cols_in_file")
+
+
+def save_manifest(filename, ruleset, cols_in_file, results):
+    """Write the check results (fingerprint -> (errors, mismatches)) of all current sentences of a file."""
+    path = manifest_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "ruleset": ruleset,
+        "cols_in_file": cols_in_file,
+        "sentences": {fingerprint: [errors, mismatches] for fingerprint, (errors, mismatches) in results.items()},
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
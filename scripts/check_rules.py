@@ -0,0 +1,207 @@
+from conll_reader import FeatsCache, cached_feats
+
+FEATURES = ['base', 'dat', 'amb', 'aux', 'spron', 'opron', 'oneg', 'sinan', 'oan', 'regpol', 'invan', 'sname', 'semas',
+            'noref', 'psy', 'pp', 'acc', 'vlight', 'syn', 'prov',
+            'VF[S]LK[V]MF[O]', 'VF[O]LK[V]MF[S]', 'VF[ADV]LK[V]MF[SO]', 'VF[ADV]LK[V]MF[OS]',
+            'LK[V]MF[SO]', 'LK[V]MF[OS]', 'MF[SO]VC[V]', 'MF[OS]VC[V]']
+
+# Lookup tables, compiled once
+VALID_FEATURES = frozenset(FEATURES)
+# Canonical order of the topological fields
+TF_HIERARCHY = ["C", "VF", "LK", "MF", "RK", "VC", "NF"]
+TF_POSITIONS = {f: i for i, f in enumerate(TF_HIERARCHY)}
+VERB_DEPRELS = frozenset({"root", "verb"})
+VERB_DEPENDENT_DEPRELS = frozenset({"nsubj", "obj", "obl", "mark", "advmod", "punct", "aux"})
+
+
+class Rule:
+    __slots__ = ("name", "func", "needs_heads", "description")
+
+    def __init__(self, name, func, needs_heads, description):
+        self.name = name
+        self.func = func
+        self.needs_heads = needs_heads
+        self.description = description
+
+
+# All registered rules by name, in the order in which their messages are reported
+RULES = {}
+
+
+def rule(name, needs_heads=False):
+    """
+    Register a check. The decorated function takes a SentenceFacts object and returns a list of
+    (check id, message) pairs. Rules with needs_heads only run on files with HEAD/DEPREL columns.
+    """
+    def register(func):
+        RULES[name] = Rule(name, func, needs_heads, (func.__doc__ or "").strip())
+        return func
+    return register
+
+
+def select_rules(names=None):
+    """Return the registered rules with the given names (all rules if names is None), in registration order."""
+    if names is None:
+        return list(RULES.values())
+    unknown = [name for name in names if name not in RULES]
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(unknown)}. Available: {', '.join(RULES)}")
+    return [r for r in RULES.values() if r.name in names]
+
+
+class FeatsFacts:
+    """What the rules need to know about one distinct FEATS string."""
+    __slots__ = ("order", "invalid", "tf")
+
+    def __init__(self, feats_str):
+        feats = cached_feats(feats_str)
+        self.order = feats.get("order") or None
+        self.invalid = []
+        if self.order and self.order not in VALID_FEATURES:
+            self.invalid.append(("invalid_order", f"Invalid order: '{self.order}'"))
+        prop_value = feats.get("props")
+        if prop_value:
+            for prop in prop_value.split("-"):
+                prop = prop.strip()
+                if prop and prop not in VALID_FEATURES:
+                    self.invalid.append(("invalid_prop", f"Invalid prop: '{prop}'"))
+        tf = feats.get("tf")
+        self.tf = tf if tf and tf != "UNK" else None
+
+
+# Analysed FEATS strings shared by all sentences and files; the annotated files have a few thousand distinct ones
+MAX_FEATS_FACTS = 1 << 16
+_feats_facts = FeatsCache(FeatsFacts, MAX_FEATS_FACTS, "feats_facts")
+
+
+class SentenceFacts:
+    """
+    Per-sentence input of the rules: the ID, HEAD and DEPREL columns plus the FEATS-derived values, collected in a
+    single pass over the tokens. Every distinct FEATS string is analysed only once per run.
+    """
+    __slots__ = ("sentence", "indices", "heads", "deprels", "orders", "invalid_features", "tf_fields")
+
+    def __init__(self, sentence, indices, heads, deprels):
+        self.sentence = sentence
+        self.indices = indices
+        self.heads = heads
+        self.deprels = deprels
+        self.orders = set()
+        self.invalid_features = []
+        self.tf_fields = []
+
+        for feats_str in sentence.feats_strings():
+            facts = _feats_facts.get(feats_str)
+            if facts.order:
+                self.orders.add(facts.order)
+            if facts.invalid:
+                self.invalid_features.extend(facts.invalid)
+            if facts.tf:
+                self.tf_fields.append(facts.tf)
+
+
+def format_values(values):
+    return sorted(v if v is not None else "[MISSING]" for v in values)
+
+
+@rule("valid_features")
+def check_valid_features(facts):
+    """Word order and props values are known FEATURES."""
+    return facts.invalid_features
+
+
+@rule("order_consistency")
+def check_order_consistency(facts):
+    """All tokens of a sentence carry the same word order."""
+    if len(facts.orders) > 1:
+        return [("order_mismatch", f"order: {format_values(facts.orders)}")]
+    return []
+
+
+@rule("tf_order")
+def check_tf_order(facts):
+    """Topological fields (tf:<FIELD>) appear in canonical order; only the first violation is reported."""
+    tf_fields = facts.tf_fields
+    previous = None
+    for i, field in enumerate(tf_fields):
+        position = TF_POSITIONS.get(field, -1)
+        if previous is not None and position < previous:
+            return [("tf_order", f"topological field order error: {field} precedes {tf_fields[i - 1]}")]
+        previous = position
+    return []
+
+
+@rule("id_continuity")
+def check_id_continuity(facts):
+    """Token IDs are well-formed, unique and consecutive from 1."""
+    indices = facts.indices
+    if None in indices:
+        return [("id_malformed", "indices: [MALFORMED]")]
+    if len(indices) != len(set(indices)):
+        return [("id_duplicate", "duplicate IDs in sentence")]
+    if sorted(indices) != list(range(1, len(indices) + 1)):
+        return [("id_not_consecutive", f"indices not consecutive: {sorted(indices)}")]
+    return []
+
+
+@rule("head_bounds", needs_heads=True)
+def check_head_bounds(facts):
+    """HEADs are within the sentence, do not point to the token itself or to the last token."""
+    indices = facts.indices
+    heads = facts.heads
+    if None in indices or None in heads:
+        return []
+
+    max_idx = max(indices)
+    last_token_heads = []
+    head_errors = []
+    for idx, h in zip(indices, heads):
+        if h == idx:
+            head_errors.append(("head_self", f"HEAD=ID at token {idx}"))
+        if h > max_idx:
+            head_errors.append(("head_out_of_range", f"HEAD>{max_idx} at token {idx} (head={h})"))
+        if h < 0:
+            head_errors.append(("head_negative", f"HEAD<0 at token {idx} (head={h})"))
+        if h == max_idx:
+            last_token_heads.append(("head_last_token", f"HEAD points to last token ID {max_idx} (from token {idx})"))
+    return last_token_heads + head_errors
+
+
+@rule("deprel_multiplicity", needs_heads=True)
+def check_deprel_multiplicity(facts):
+    """Exactly one nsubj and one obj per sentence."""
+    mismatches = []
+    nsubj_count = facts.deprels.count("nsubj")
+    obj_count = facts.deprels.count("obj")
+    if nsubj_count > 1:
+        mismatches.append(("nsubj_multiple", f"multiple nsubj ({nsubj_count})"))
+    if obj_count > 1:
+        mismatches.append(("obj_multiple", f"multiple obj ({obj_count})"))
+    if nsubj_count == 0:
+        mismatches.append(("nsubj_missing", "missing nsubj"))
+    if obj_count == 0:
+        mismatches.append(("obj_missing", "missing obj"))
+    return mismatches
+
+
+@rule("verb_attachment", needs_heads=True)
+def check_verb_attachment(facts):
+    """nsubj, obj, obl, mark, advmod, punct and aux attach to a verb/root token."""
+    verb_heads = {idx for idx, rel in zip(facts.indices, facts.deprels) if rel in VERB_DEPRELS}
+    return [("verb_attachment", f"{rel} at token {idx} doesn't attach to verb/root (head={head})")
+            for idx, head, rel in zip(facts.indices, facts.heads, facts.deprels)
+            if rel in VERB_DEPENDENT_DEPRELS and head not in verb_heads]
+
+
+def run_rules(rules, sentence, indices, heads, deprels, cols_in_file):
+    """Run the given rules on a sentence and return the list of (check id, message) mismatches."""
+    facts = SentenceFacts(sentence, indices, heads, deprels)
+    has_heads = cols_in_file >= 7
+    mismatches = []
+    for r in rules:
+        if has_heads or not r.needs_heads:
+            try:
+                mismatches.extend(r.func(facts))
+            except Exception as e:
+                mismatches.append(("check_error", f"[ERROR during {r.name} check: {e}]"))
+    return mismatches
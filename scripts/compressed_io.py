@@ -0,0 +1,75 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+# Large reads and writes: the suite files are long runs of short, highly repetitive lines
+BUFFER_SIZE = 1 << 20
+
+COMPRESSED_EXTENSIONS = {".gz": gzip, ".bz2": bz2, ".xz": lzma}
+_MAGIC_NUMBERS = [(b"\x1f\x8b", gzip), (b"BZh", bz2), (b"\xfd7zXZ\x00", lzma)]
+
+
+def strip_compression(path):
+    """Return a path without its compression extension, e.g. 'x.conll.gz' -> 'x.conll'."""
+    root, extension = os.path.splitext(path)
+    return root if extension in COMPRESSED_EXTENSIONS else path
+
+
+def _compression(path, mode):
+    """Return the compression module of a file: sniffed from its first bytes when reading, else from its name."""
+    if "r" in mode:
+        with open(path, "rb") as f:
+            head = f.read(6)
+        for magic, module in _MAGIC_NUMBERS:
+            if head.startswith(magic):
+                return module
+        return None
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(path)[1])
+
+
+def open_file(path, mode="r", encoding="utf-8"):
+    """
+    Open a plain, gzip, bzip2 or xz compressed file with a large buffer, like open(). Compressed files are detected
+    by their magic number when reading and by their extension (.gz, .bz2, .xz) when writing. Binary modes return
+    seekable buffered streams, but seeking backwards in a compressed file decompresses it again from the start:
+    use open_random_access to read at offsets that are not sorted.
+    """
+    binary = "b" in mode
+    raw_mode = mode.replace("b", "").replace("t", "") + "b"
+    module = _compression(path, raw_mode)
+
+    if module is None:
+        if binary:
+            return open(path, raw_mode, buffering=BUFFER_SIZE)
+        return open(path, raw_mode.replace("b", ""), buffering=BUFFER_SIZE, encoding=encoding)
+
+    stream = module.open(path, raw_mode)
+    if "r" in raw_mode:
+        stream = io.BufferedReader(stream, BUFFER_SIZE)
+    else:
+        stream = io.BufferedWriter(stream, BUFFER_SIZE)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def is_compressed(path):
+    return _compression(path, "rb") is not None
+
+
+def _non_decreasing(offsets):
+    return all(a <= b for a, b in zip(offsets, offsets[1:]))
+
+
+def open_random_access(path, offsets=None):
+    """
+    Open a file for binary reads at arbitrary offsets (seek, then read). Plain files, and compressed files that
+    are read at the given non-decreasing offsets, are streamed. Otherwise a compressed file is decompressed into
+    memory once, since every backward seek in a compressed stream would decompress it again from the start.
+    """
+    if not is_compressed(path) or (offsets is not None and _non_decreasing(offsets)):
+        return open_file(path, "rb")
+    with open_file(path, "rb") as f:
+        return io.BytesIO(f.read())
@@ -1,91 +1,155 @@
+import argparse
+import contextlib
+import hashlib
+
+from compressed_io import open_file, open_random_access
+from conll_reader import FORM, FEATS, cached_feats, read_sentence_spans, read_sentences, write_sentence
+from conll_view import FORMATS, convert_chunk, detect_format
+from profiler import Profiler, profile_path
+
+
 def read_conll_file(filename):
-    """Read a CoNLL-X file and return a list of sentences (each a list of lines)."""
-    sentences = []
-    current = []
-    with open(filename, encoding='utf-8') as f:
-        for line in f:
-            line = line.rstrip('\n')
-            if line:
-                current.append(line)
-            else:
-                if current:
-                    sentences.append(current)
-                    current = []
-        if current:
-            sentences.append(current)
-    return sentences
+    """Read a CoNLL-X file and return a list of sentences."""
+    return list(read_sentences(filename))
 
 
 def extract_order_and_props(feats):
     """Extract 'order' and 'props' from FEATS column."""
-    order = None
-    props = None
-    for feat in feats.split('|'):
-        if feat.startswith('order:'):
-            order = feat[len('order:'):]
-        elif feat.startswith('props:'):
-            props = feat[len('props:'):]
-    return order, props
+    parsed = cached_feats(feats)
+    return parsed.get('order'), parsed.get('props')
 
 
 def build_sentence_key(sentence):
     """Return a tuple key: (order, props, set of surface forms)"""
-    forms = set()
-    order = None
-    props = None
+    # Skip malformed lines
+    forms = frozenset(cols[FORM] for cols in sentence.rows if len(cols) > FEATS)
+    return (sentence.order, sentence.props, forms)
 
-    for line in sentence:
-        if line.startswith('#'):
-            continue  # skip comments if any
-        cols = line.split('\t')
-        if len(cols) < 6:
-            continue  # malformed line
-        form = cols[1]
-        feats = cols[5]
 
-        # Extract once (all tokens should have same order/props)
-        if order is None or props is None:
-            order_tmp, props_tmp = extract_order_and_props(feats)
-            if order_tmp is not None:
-                order = order_tmp
-            if props_tmp is not None:
-                props = props_tmp
+def replace_sentences(original_file, fixes_file, output_file, profiler=None, as_format=None):
+    # With as_format ('conll' or 'conllu'), both files are read (and the output is written) in that format
+    fixes = read_sentences(fixes_file, as_format)
+    originals = read_sentences(original_file, as_format)
+    key = build_sentence_key
+    write = write_sentence
+    if profiler is not None:
+        fixes = profiler.iterate(fixes, "read fixes")
+        originals = profiler.iterate(originals, "read")
+        key = profiler.wrap(key, "key")
+        write = profiler.wrap(write, "write")
 
-        forms.add(form)
+    # Build fix map
+    fix_map = {key(s): s for s in fixes}
 
-    return (order, props, frozenset(forms))
+    # Stream the original file through to the merged output
+    with open_file(output_file, 'w') as f:
+        for orig in originals:
+            write(f, fix_map.get(key(orig), orig))
 
 
-def replace_sentences(original_file, fixes_file, output_file):
-    original_sentences = read_conll_file(original_file)
-    fix_sentences = read_conll_file(fixes_file)
+def sentence_fingerprint(sentence):
+    """Return a compact hash of build_sentence_key(sentence): order, props and the set of surface forms."""
+    order, props, forms = build_sentence_key(sentence)
+    key = "\x1f".join([order or "\x00", props or "\x00"] + sorted(forms))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _copy_span(f_in, f_out, start, end, as_format=None):
+    f_in.seek(start)
+    chunk = f_in.read(end - start)
+    if as_format is not None:
+        chunk = convert_chunk(chunk, as_format)
+    f_out.write(chunk if chunk.endswith(b"\n") else chunk + b"\n")
+    f_out.write(b"\n")
 
-    # Build fix map
-    fix_map = {build_sentence_key(s): s for s in fix_sentences}
 
-    output_sentences = []
-    for orig in original_sentences:
-        key = build_sentence_key(orig)
-        if key in fix_map:
-            output_sentences.append(fix_map[key])
-        else:
-            output_sentences.append(orig)
+def _span_length(span):
+    return len(span[2])
 
-    # Write merged output
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for sentence in output_sentences:
-            for line in sentence:
-                f.write(line + '\n')
-            f.write('\n')
+
+def merge_sentences_streaming(original_file, fixes_file, output_file, profiler=None, as_format=None):
+    """
+    Memory-bounded variant of replace_sentences. Only a fingerprint -> byte range index of the fixes file is kept
+    in memory; the original is streamed to the output one sentence at a time, and sentences are copied as raw
+    bytes from whichever file they come from, with their FEATS separators rewritten if as_format ('conll' or
+    'conllu') differs from the format of that file. Returns a report with the number of replaced sentences, fixes
+    sharing a key with an earlier fix (the last one wins, as in replace_sentences) and fixes that were never used.
+    """
+    fix_spans = read_sentence_spans(fixes_file)
+    original_spans = read_sentence_spans(original_file)
+    fingerprint_of = sentence_fingerprint
+    copy = _copy_span
+    if profiler is not None:
+        fix_spans = profiler.iterate(fix_spans, "read fixes", _span_length)
+        original_spans = profiler.iterate(original_spans, "read", _span_length)
+        fingerprint_of = profiler.wrap(fingerprint_of, "key")
+        copy = profiler.wrap(copy, "write")
+
+    # Target format per source file, None where no conversion is needed
+    convert_fixes = as_format if as_format is not None and detect_format(fixes_file) != as_format else None
+    convert_original = as_format if as_format is not None and detect_format(original_file) != as_format else None
+
+    fix_index = {}
+    collisions = []
+    for start, end, sentence in fix_spans:
+        fingerprint = fingerprint_of(sentence)
+        if fingerprint in fix_index:
+            collisions.append(sentence.index)
+        fix_index[fingerprint] = (start, end, sentence.index)
+
+    used = set()
+    replaced = 0
+    total = 0
+    # The original is read in order, the fixes at random
+    with open_random_access(fixes_file) as fixes, open_file(original_file, 'rb') as original, \
+            open_file(output_file, 'wb') as f_out:
+        for start, end, sentence in original_spans:
+            total += 1
+            fingerprint = fingerprint_of(sentence)
+            fix = fix_index.get(fingerprint)
+            if fix is None:
+                copy(original, f_out, start, end, convert_original)
+            else:
+                copy(fixes, f_out, fix[0], fix[1], convert_fixes)
+                used.add(fingerprint)
+                replaced += 1
+
+    unused = sorted(fix[2] for fingerprint, fix in fix_index.items() if fingerprint not in used)
+    return {"sentences": total, "replaced": replaced, "collisions": collisions, "unused_fixes": unused}
 
 
 # Takes an original conll file and replaces all sentences by those contained in a fixed conll file. All sentences not
 # contained in the fixer file are preserved.
 if __name__ == '__main__':
-    original_file = "/german/gold/german_part-amb_gold_all-heads.conll"
-    original_file2 = "/Users/patricia/Code/SORTS/german/gold/german_part-amb_gold.conll"
-    fix_file = "/Users/patricia/Code/SORTS/german/pp/pp_part-amb_all-heads.conll"
-    fix_file2 = "/Users/patricia/Code/SORTS/german/pp/pp_part-amb.conll"
-    orig_fixed_file = "/Users/patricia/Code/SORTS/german/gold/german_part-amb_gold_all-heads_fixed-pp.conll"
-    orig_fixed_file2 = "/Users/patricia/Code/SORTS/german/gold/german_part-amb_gold_fixed-pp.conll"
-    replace_sentences(original_file, fix_file, orig_fixed_file)
+    # e.g. /Users/patricia/Code/SORTS/german/gold/german_part-amb_gold_all-heads.conll
+    #      /Users/patricia/Code/SORTS/german/pp/pp_part-amb_all-heads.conll
+    #      /Users/patricia/Code/SORTS/german/gold/german_part-amb_gold_all-heads_fixed-pp.conll
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("original_file", type=str)
+    argparser.add_argument("fix_file", type=str)
+    argparser.add_argument("orig_fixed_file", type=str)
+    argparser.add_argument("--streaming", action="store_true",
+                           help="Merge with bounded memory and report replaced, colliding and unused fixes.")
+    argparser.add_argument("--profile", action="store_true",
+                           help="Time reading, keys and writing; written to <orig_fixed_file>.profile.json.")
+    argparser.add_argument("--as", dest="as_format", choices=FORMATS, default=None,
+                           help="Write the merged file as CoNLL-X or CoNLL-U, whatever the format of the inputs.")
+    args = argparser.parse_args()
+
+    profiler = Profiler() if args.profile else None
+    if args.streaming:
+        with profiler or contextlib.nullcontext():
+            report = merge_sentences_streaming(args.original_file, args.fix_file, args.orig_fixed_file, profiler,
+                                               args.as_format)
+        print(f"Replaced {report['replaced']} of {report['sentences']} sentences")
+        if report["collisions"]:
+            print(f"{len(report['collisions'])} fixes share their key with an earlier fix (fix sentences "
+                  f"{', '.join(map(str, report['collisions']))})")
+        if report["unused_fixes"]:
+            print(f"{len(report['unused_fixes'])} fixes were not used (fix sentences "
+                  f"{', '.join(map(str, report['unused_fixes']))})")
+    else:
+        with profiler or contextlib.nullcontext():
+            replace_sentences(args.original_file, args.fix_file, args.orig_fixed_file, profiler, args.as_format)
+    if profiler is not None:
+        profiler.write(profile_path(args.orig_fixed_file))
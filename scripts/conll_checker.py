@@ -1,218 +1,308 @@
+import argparse
+import contextlib
+import hashlib
+import inspect
+import json
+import multiprocessing
 import os
 
-FEATURES = ['base', 'dat', 'amb', 'aux', 'spron', 'opron', 'oneg', 'sinan', 'oan', 'regpol', 'invan', 'sname', 'semas',
-            'noref', 'psy', 'pp', 'acc', 'vlight', 'syn', 'prov',
-            'VF[S]LK[V]MF[O]', 'VF[O]LK[V]MF[S]', 'VF[ADV]LK[V]MF[SO]', 'VF[ADV]LK[V]MF[OS]',
-            'LK[V]MF[SO]', 'LK[V]MF[OS]', 'MF[SO]VC[V]', 'MF[OS]VC[V]']
+from check_manifest import load_manifest, save_manifest, sentence_fingerprint
+from check_rules import FEATURES, RULES, FeatsFacts, Rule, SentenceFacts, run_rules, select_rules
+from compressed_io import open_file, strip_compression
+from conll_reader import cached_feats, read_sentences
+from corpus_cache import CACHE_DIRNAME, load_corpus
+from encoded_corpus import INVALID, NO_VALUE
+from profiler import Profiler, profile_path
+
+ERROR_LABELS = {"invalid_id": "Invalid ID", "invalid_head": "Invalid HEAD"}
 
 
 def extract_feature(features_str, key):
-    for item in features_str.split("|"):
-        if item.startswith(f"{key}:"):
-            return item.split(":", 1)[1]
-    return None
-
-
-def format_values(values):
-    return sorted(v if v is not None else "[MISSING]" for v in values)
-
-
-def process_single_file(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        sentence_tokens = []
-        orders = set()
-        props = set()
-        indices = []
-        heads = []
-        deprels = []
-        head_errors = []
-        sentence_index = 1
-        cols_in_file = None
-        invalid_features = []
-
-        # NEW: store topological fields if TF feature present
-        topo_fields = []
-
-        for line in f:
-            line = line.strip()
-
-            # End of sentence
-            if line == "":
-                mismatches = []
-
-                # Invalid FEATURES
-                if invalid_features:
-                    mismatches.extend(invalid_features)
-
-                # Word order mismatch
-                if len(orders) > 1:
-                    mismatches.append(f"order: {format_values(orders)}")
-
-                # --- Topological Field Order Check (based on tf:<FIELD>) ---
-                # Collect all topological fields in order of appearance
-                tf_fields = [extract_feature(feats, "tf") for feats in topo_fields]
-                tf_fields = [f for f in tf_fields if f and f != "UNK"]
-
-                if tf_fields:
-                    # Define the canonical order
-                    hierarchy = ["C", "VF", "LK", "MF", "RK", "VC", "NF"]
-                    field_positions = {f: i for i, f in enumerate(hierarchy)}
-
-                    # Convert each tf value to its numeric position in the hierarchy
-                    numeric_order = [field_positions.get(f, -1) for f in tf_fields]
-
-                    # Check that the numeric sequence never decreases (i.e. fields appear in the correct order)
-                    for i in range(1, len(numeric_order)):
-                        if numeric_order[i] < numeric_order[i - 1]:
-                            mismatches.append(
-                                f"topological field order error: {tf_fields[i]} precedes {tf_fields[i - 1]}"
-                            )
-                            break  # only report the first issue
-
-                # ID checks
-                if indices:
-                    if None in indices:
-                        mismatches.append("indices: [MALFORMED]")
-                    elif len(indices) != len(set(indices)):
-                        mismatches.append("duplicate IDs in sentence")
-                    else:
-                        expected = list(range(1, len(indices) + 1))
-                        if sorted(indices) != expected:
-                            mismatches.append(f"indices not consecutive: {sorted(indices)}")
-
-                # HEAD checks if file has enough columns
-                if cols_in_file and cols_in_file >= 7:
-                    if indices and heads and None not in indices and None not in heads:
-                        max_idx = max(indices)
-
-                        # HEAD errors
-                        for i, (idx, h) in enumerate(zip(indices, heads)):
-                            if h == idx:
-                                head_errors.append(f"HEAD=ID at token {idx}")
-                            if h > max_idx:
-                                head_errors.append(f"HEAD>{max_idx} at token {idx} (head={h})")
-                            if h < 0:
-                                head_errors.append(f"HEAD<0 at token {idx} (head={h})")
-                            if h == max_idx:
-                                mismatches.append(f"HEAD points to last token ID {max_idx} (from token {idx})")
-
-                        if head_errors:
-                            mismatches.extend(head_errors)
-
-                    # Deprel multiplicity check
-                    if deprels:
-                        nsubj_count = deprels.count("nsubj")
-                        obj_count = deprels.count("obj")
-                        if nsubj_count > 1:
-                            mismatches.append(f"multiple nsubj ({nsubj_count})")
-                        if obj_count > 1:
-                            mismatches.append(f"multiple obj ({obj_count})")
-                        if nsubj_count == 0:
-                            mismatches.append("missing nsubj")
-                        if obj_count == 0:
-                            mismatches.append("missing obj")
-
-                    # Specific DEPREL → verb/root HEAD check
-                    try:
-                        token_info = list(zip(indices, heads, deprels))
-                        verb_heads = {idx for idx, _, rel in token_info if rel in {"root", "verb"}}
-                        target_deprels = {"nsubj", "obj", "obl", "mark", "advmod", "punct", "aux"}
-                        for idx, head, rel in token_info:
-                            if rel in target_deprels and head not in verb_heads:
-                                mismatches.append(f"{rel} at token {idx} doesn't attach to verb/root (head={head})")
-                    except Exception as e:
-                        mismatches.append(f"[ERROR during deprel-head check: {e}]")
-
-                # Print mismatches
-                if mismatches:
-                    print(f"[{os.path.basename(file_path)}] Sentence {sentence_index} – mismatches: {', '.join(mismatches)}")
-                    print("  " + " ".join(sentence_tokens))
-                    print()
-
-                # Reset for next sentence
-                sentence_index += 1
-                sentence_tokens = []
-                orders.clear()
-                props.clear()
-                indices = []
-                heads = []
-                deprels = []
-                head_errors = []
-                invalid_features = []
-                topo_fields = []  # reset topo field tracker
-                continue
+    return cached_feats(features_str).get(key)
+
+
+def read_columns(sentence, cols_in_file):
+    """
+    Return the ID, HEAD and DEPREL columns of a sentence, with None for missing or malformed values, and the list
+    of (check id, value) errors for malformed IDs and HEADs.
+    """
+    indices = []
+    heads = []
+    deprels = []
+    errors = []
+
+    for cols in sentence.rows:
+        # ID
+        try:
+            idx = int(cols[0])
+        except ValueError:
+            errors.append(("invalid_id", cols[0]))
+            idx = None
+        indices.append(idx)
+
+        # HEAD
+        head = None
+        if cols_in_file >= 7 and len(cols) > 6:
+            head_val = cols[6]
+            if head_val != "_":
+                try:
+                    head = int(head_val)
+                except ValueError:
+                    errors.append(("invalid_head", head_val))
+        heads.append(head)
+
+        # DEPREL
+        deprels.append(cols[7] if len(cols) > 7 else None)
+
+    return indices, heads, deprels, errors
+
+
+def read_encoded_columns(sentence, cols_in_file):
+    """
+    Like read_columns, but takes the columns from a cached corpus. Only sentences with malformed IDs or HEADs
+    are read back from the text file to report them.
+    """
+    corpus = sentence.corpus
+    start, end = sentence.start, sentence.end
+    indices = corpus.as_list("ids")[start:end]
+    heads = corpus.as_list("heads")[start:end]
+    if min(indices) < 0 or INVALID in heads:
+        return read_columns(sentence, cols_in_file)
+
+    if cols_in_file >= 7:
+        heads = [h if h != NO_VALUE else None for h in heads]
+    else:
+        heads = [None] * len(indices)
+    deprels = corpus.decoded("deprel_codes", corpus.deprel_vocab)[start:end]
+    return indices, heads, deprels, []
+
+
+def profiled_rules(rules, profiler):
+    """Return the rules with every check timed as the phase check:<name>."""
+    return [Rule(r.name, profiler.wrap(r.func, f"check:{r.name}"), r.needs_heads, r.description) for r in rules]
+
+
+def iter_file_results(file_path, use_cache=False, start=0, end=None, corpus=None, rules=None, profiler=None):
+    """
+    Check the sentences of a file and yield (sentence, errors, mismatches) for each of them. With use_cache (or
+    an already loaded corpus), only the sentences start..end (0-based, end exclusive) are checked.
+    With a profiler, reading, column extraction, the rules as a whole and every single check are timed.
+    """
+    cols_in_file = None
+    rules = select_rules() if rules is None else rules
+
+    if use_cache or corpus is not None:
+        if corpus is None:
+            corpus = load_corpus(file_path)
+        cols_in_file = int(corpus.n_columns[0]) if corpus.n_tokens else 0
+        sentences = corpus.sentences(start, end)
+        columns_reader = read_encoded_columns
+    else:
+        sentences = read_sentences(file_path)
+        columns_reader = read_columns
+
+    check = run_rules
+    if profiler is not None:
+        sentences = profiler.iterate(sentences, "read")
+        columns_reader = profiler.wrap(columns_reader, "columns")
+        check = profiler.wrap(run_rules, "rules")
+        rules = profiled_rules(rules, profiler)
+
+    for sentence in sentences:
+        # Detect column count once per file
+        if cols_in_file is None:
+            cols_in_file = len(sentence.rows[0])
+
+        indices, heads, deprels, errors = columns_reader(sentence, cols_in_file)
+        yield sentence, errors, check(rules, sentence, indices, heads, deprels, cols_in_file)
+
+
+def ruleset_fingerprint(rules):
+    """Return a hash of the selected rules and their code, so that cached results are dropped whenever they change."""
+    engine = [read_columns, SentenceFacts, FeatsFacts, run_rules]
+    parts = [inspect.getsource(obj) for obj in engine] + [repr(FEATURES)]
+    parts.extend(f"{r.name}:{r.needs_heads}:{inspect.getsource(r.func)}" for r in rules)
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def iter_incremental_results(file_path, stats, rules=None):
+    """
+    Like iter_file_results, but reuses the results stored in the file's check manifest for every sentence whose
+    fingerprint is unchanged, and only checks new or edited sentences. The manifest is rewritten at the end.
+    Counts of checked and total sentences are added to stats.
+    """
+    rules = select_rules() if rules is None else rules
+    ruleset = ruleset_fingerprint(rules)
+    cached, cached_cols = load_manifest(file_path, ruleset)
+    results = {}
+    cols_in_file = None
+
+    for sentence in read_sentences(file_path):
+        if cols_in_file is None:
+            cols_in_file = len(sentence.rows[0])
+            if cols_in_file != cached_cols:
+                cached = {}
+
+        fingerprint = sentence_fingerprint(sentence)
+        result = results.get(fingerprint) or cached.get(fingerprint)
+        if result is None:
+            indices, heads, deprels, errors = read_columns(sentence, cols_in_file)
+            result = (errors, run_rules(rules, sentence, indices, heads, deprels, cols_in_file))
+            stats["checked"] = stats.get("checked", 0) + 1
+        stats["total"] = stats.get("total", 0) + 1
+        results[fingerprint] = result
+        yield sentence, result[0], result[1]
+
+    save_manifest(file_path, ruleset, cols_in_file, results)
+
+
+def print_results(file_name, sentence, errors, mismatches):
+    for check_id, value in errors:
+        print(f"[ERROR] {ERROR_LABELS[check_id]} in {file_name}, sentence {sentence.index}: '{value}'")
+
+    # Print mismatches
+    if mismatches:
+        print(f"[{file_name}] Sentence {sentence.index} – mismatches: {', '.join(m for _, m in mismatches)}")
+        print("  " + " ".join(sentence.forms))
+        print()
+
+
+def process_single_file(file_path, use_cache=False, incremental=False, rules=None, profiler=None):
+    file_name = os.path.basename(file_path)
+    stats = {}
+
+    if incremental:
+        results = iter_incremental_results(file_path, stats, rules)
+        if profiler is not None:
+            results = profiler.iterate(results, "check", lambda result: len(result[0]))
+    else:
+        results = iter_file_results(file_path, use_cache, rules=rules, profiler=profiler)
+
+    report = print_results if profiler is None else profiler.wrap(print_results, "write")
+    for sentence, errors, mismatches in results:
+        report(file_name, sentence, errors, mismatches)
+
+    if incremental:
+        print(f"[{file_name}] rechecked {stats.get('checked', 0)} of {stats.get('total', 0)} sentences")
+
+
+def process_directory(directory_path, use_cache=False, incremental=False, rules=None, profiler=None):
+    for filename in os.listdir(directory_path):
+        if filename == CACHE_DIRNAME:
+            continue
+        print(filename)
+        if strip_compression(filename).endswith(".conll"):
+            full_path = os.path.join(directory_path, filename)
+            process_single_file(full_path, use_cache, incremental, rules, profiler)
 
-            # Parse line
-            cols = line.split("\t")
 
-            # Detect column count once per file
-            if cols_in_file is None and len(cols) >= 1:
-                cols_in_file = len(cols)
+def find_conll_files(directories):
+    """Return the sorted paths of all .conll files (also compressed) in the given directories."""
+    return sorted(os.path.join(directory, filename)
+                  for directory in directories
+                  for filename in os.listdir(directory)
+                  if strip_compression(filename).endswith(".conll"))
 
-            if len(cols) < 1:
-                print(f"[ERROR] Malformed line in {os.path.basename(file_path)}, sentence {sentence_index}: {line}")
-                continue
 
-            token = cols[1] if len(cols) > 1 else "[MISSING]"
-            feats = cols[5] if len(cols) > 5 else ""
-            sentence_tokens.append(token)
-
-            topo_fields.append(feats)
-
-            # ID
-            try:
-                idx = int(cols[0])
-            except (ValueError, IndexError):
-                print(f"[ERROR] Invalid ID in {os.path.basename(file_path)}, sentence {sentence_index}: '{cols[0] if len(cols) > 0 else ''}'")
-                idx = None
-            indices.append(idx)
-
-            # HEAD
-            head = None
-            if cols_in_file >= 7 and len(cols) > 6:
-                head_val = cols[6]
-                if head_val == "_":
-                    head = None
-                else:
-                    try:
-                        head = int(head_val)
-                    except ValueError:
-                        print(f"[ERROR] Invalid HEAD in {os.path.basename(file_path)}, sentence {sentence_index}: '{head_val}'")
-                        head = None
-            heads.append(head)
-
-            # DEPREL
-            deprel = cols[7] if len(cols) > 7 else None
-            deprels.append(deprel)
-
-            # Order feature
-            order_value = extract_feature(feats, "order")
-            if order_value:
-                orders.add(order_value)
-                if order_value not in FEATURES:
-                    invalid_features.append(f"Invalid order: '{order_value}'")
-
-            # Props feature
-            prop_value = extract_feature(feats, "props")
-            if prop_value:
-                for prop in prop_value.split("-"):
-                    prop = prop.strip()
-                    if prop:
-                        props.add(prop)
-                        if prop not in FEATURES:
-                            invalid_features.append(f"Invalid prop: '{prop}'")
-
-
-def process_directory(directory_path):
-    for filename in os.listdir(directory_path):
-        print(filename)
-        if filename.endswith(".conll"):
-            full_path = os.path.join(directory_path, filename)
-            process_single_file(full_path)
+def _count_sentences(file_path):
+    # Also builds the corpus cache of the file, so that all later range tasks can memory-map it
+    return load_corpus(file_path).n_sentences
+
+
+# Corpus last loaded by a worker process; consecutive tasks usually cover ranges of the same file
+_worker_corpus = {}
+
+
+def _check_range(task):
+    file_path, start, end, rule_names, profile = task
+    profiler = Profiler() if profile else None
+    with profiler or contextlib.nullcontext():
+        corpus = _worker_corpus.get(file_path)
+        if corpus is None:
+            _worker_corpus.clear()
+            corpus = _worker_corpus[file_path] = load_corpus(file_path)
+
+        records = []
+        for sentence, errors, mismatches in iter_file_results(file_path, start=start, end=end, corpus=corpus,
+                                                              rules=select_rules(rule_names), profiler=profiler):
+            if not errors and not mismatches:
+                continue
+            tokens = sentence.forms
+            for check_id, value in errors:
+                records.append({"file": file_path, "sentence": sentence.index, "check": check_id,
+                                "message": f"{ERROR_LABELS[check_id]}: '{value}'", "tokens": tokens})
+            for check_id, message in mismatches:
+                records.append({"file": file_path, "sentence": sentence.index, "check": check_id,
+                                "message": message, "tokens": tokens})
+    return records, None if profiler is None else profiler.report()
+
+
+def check_parallel(file_paths, report_path, jobs=None, chunk_size=2000, rules=None, profiler=None):
+    """
+    Check files on a process pool, splitting them into ranges of chunk_size sentences, and write one JSON record
+    per mismatch to report_path (JSON Lines). The records are written in file and sentence order, whatever the
+    number of workers. Returns the number of mismatches per check id, which is also written to
+    <report_path>.summary.json (without a compression extension).
+    With a profiler, the workers profile their ranges and their phase times are added up in it.
+    """
+    summary = {}
+    with multiprocessing.Pool(jobs) as pool:
+        counts = pool.map(_count_sentences, file_paths)
+        rule_names = None if rules is None else [r.name for r in rules]
+        tasks = [(file_path, start, min(start + chunk_size, n), rule_names, profiler is not None)
+                 for file_path, n in zip(file_paths, counts)
+                 for start in range(0, n, chunk_size)]
+
+        with open_file(report_path, "w") as report:
+            for records, profile in pool.imap(_check_range, tasks):
+                if profile is not None:
+                    profiler.merge(profile)
+                for record in records:
+                    summary[record["check"]] = summary.get(record["check"], 0) + 1
+                    report.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    summary = dict(sorted(summary.items()))
+    with open(strip_compression(report_path) + ".summary.json", "w", encoding="utf-8") as f:
+        json.dump({"files": len(file_paths), "sentences": sum(counts), "checks": summary}, f, indent=2)
+    return summary
 
 
 if __name__ == "__main__":
-    directory = "/Users/patricia/Code/SORTS/german/gold/"
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("directories", type=str, nargs="*", default=["/Users/patricia/Code/SORTS/german/gold/"])
     # directory = "/Users/patricia/Code/SORTS/german/results_2025/"  # Maybe good to get an idea of the errors made
-    print("Checked directory: " + directory)
-    process_directory(directory)
+    argparser.add_argument("--cache", action="store_true",
+                           help="Read the files through the binary corpus cache (see corpus_cache.py).")
+    argparser.add_argument("--incremental", action="store_true",
+                           help="Only recheck sentences that changed since the last run (see check_manifest.py).")
+    argparser.add_argument("--rules", type=str, default=None,
+                           help="Comma-separated names of the rules to run (default: all, see --list-rules).")
+    argparser.add_argument("--list-rules", action="store_true", help="List the available rules and exit.")
+    argparser.add_argument("--report", type=str, default=None,
+                           help="Check in parallel and write a JSON Lines report instead of printing mismatches.")
+    argparser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes for --report.")
+    argparser.add_argument("--chunk-size", type=int, default=2000, help="Sentences per parallel task for --report.")
+    argparser.add_argument("--profile", action="store_true",
+                           help="Time every phase and check; the JSON profile is written next to --report "
+                                "(<report>.profile.json) or else to stderr.")
+    args = argparser.parse_args()
+
+    if args.list_rules:
+        for r in RULES.values():
+            print(f"{r.name}\t{r.description}")
+        raise SystemExit
+
+    selected_rules = select_rules(args.rules.split(",") if args.rules else None)
+    profiler = Profiler() if args.profile else None
+    with profiler or contextlib.nullcontext():
+        if args.report:
+            summary = check_parallel(find_conll_files(args.directories), args.report, args.jobs, args.chunk_size,
+                                     selected_rules, profiler)
+            for check_id, count in summary.items():
+                print(f"{check_id}\t{count}")
+        else:
+            for directory in args.directories:
+                print("Checked directory: " + directory)
+                process_directory(directory, args.cache, args.incremental, selected_rules, profiler)
+    if profiler is not None:
+        profiler.write(profile_path(args.report) if args.report else "-")
@@ -0,0 +1,233 @@
+import sys
+
+from compressed_io import open_file
+
+ID = 0
+FORM = 1
+LEMMA = 2
+UPOS = 3
+XPOS = 4
+FEATS = 5
+HEAD = 6
+DEPREL = 7
+
+# Word order and property classes as listed in the README
+WORD_ORDERS = ['LK[V]MF[SO]', 'VF[S]LK[V]MF[O]', 'VF[ADV]LK[V]MF[SO]', 'MF[SO]VC[V]',
+               'LK[V]MF[OS]', 'VF[O]LK[V]MF[S]', 'VF[ADV]LK[V]MF[OS]', 'MF[OS]VC[V]']
+PROPERTIES = ['acc', 'dat', 'amb', 'spron', 'opron', 'oneg', 'aux', 'pp', 'sinan', 'oan', 'invan', 'regpol',
+              'sname', 'semas', 'noref', 'psy', 'vlight', 'syn', 'prov']
+
+
+def parse_feats(feats_str):
+    """
+    Split a FEATS string into a key -> value dict.
+    Both the CoNLL-X ('order:...') and the CoNLL-U ('order=...') separators are accepted.
+    """
+    parsed = {}
+    if not feats_str or feats_str == "_":
+        return parsed
+    for item in feats_str.split("|"):
+        colon = item.find(":")
+        equals = item.find("=")
+        if colon == -1 and equals == -1:
+            continue
+        if colon == -1 or (equals != -1 and equals < colon):
+            key, _, value = item.partition("=")
+        else:
+            key, _, value = item.partition(":")
+        parsed[key] = value
+    return parsed
+
+
+# Distinct FEATS strings kept per cache. All tokens of a sentence carry the same FEATS string and the annotated files
+# repeat a few thousand Morph/NE/tf combinations, so this bound is only reached by unusual inputs
+MAX_CACHED_FEATS = 1 << 16
+
+
+FEATS_CACHES = {}
+
+
+class FeatsCache:
+    """
+    A bounded memo of a function of FEATS strings (by default parse_feats), shared by all sentences, files and
+    tools of a run. Keys are interned; a full cache is emptied and refilled. Counts hits, misses and evictions.
+    Every cache is registered in FEATS_CACHES under its name, so that profiler.py can report all of them.
+    """
+    __slots__ = ("name", "build", "max_size", "hits", "misses", "evictions", "_values")
+
+    def __init__(self, build=parse_feats, max_size=MAX_CACHED_FEATS, name="parse_feats"):
+        if name in FEATS_CACHES:
+            raise ValueError(f"A FEATS cache named '{name}' already exists")
+        FEATS_CACHES[name] = self
+        self.name = name
+        self.build = build
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, feats_str):
+        value = self._values.get(feats_str)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        if len(self._values) >= self.max_size:
+            self._values.clear()
+            self.evictions += 1
+        value = self._values[sys.intern(feats_str)] = self.build(feats_str)
+        return value
+
+    def stats(self):
+        return {"size": len(self._values), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+FEATS_CACHE = FeatsCache()
+
+
+def cached_feats(feats_str):
+    """Like parse_feats, but parse every distinct FEATS string only once. The returned dict is shared: do not modify."""
+    return FEATS_CACHE.get(feats_str)
+
+
+class Sentence:
+    """
+    A single sentence of a CoNLL file. Each token line is split into its columns exactly once,
+    and the FEATS strings are parsed once per distinct string rather than once per token (see FEATS_CACHE).
+    """
+    __slots__ = ("index", "rows", "comments", "_feats")
+
+    def __init__(self, index, rows, comments=None):
+        self.index = index
+        self.rows = rows
+        self.comments = comments or []
+        self._feats = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, col, default=None):
+        return [cols[col] if len(cols) > col else default for cols in self.rows]
+
+    @property
+    def forms(self):
+        return self.column(FORM, "[MISSING]")
+
+    def feats_strings(self):
+        return self.column(FEATS, "")
+
+    def token_feats(self):
+        """Return the parsed FEATS dict of every token; tokens sharing a FEATS string share the dict."""
+        if self._feats is None:
+            self._feats = [FEATS_CACHE.get(cols[FEATS] if len(cols) > FEATS else "") for cols in self.rows]
+        return self._feats
+
+    def feature(self, key):
+        """Return the value of a sentence-level feature (e.g. order, props) taken from the first token carrying it."""
+        for feats in self.token_feats():
+            value = feats.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def feature_values(self, key):
+        """Return the values of a feature for every token (None where missing)."""
+        return [feats.get(key) for feats in self.token_feats()]
+
+    @property
+    def order(self):
+        return self.feature("order")
+
+    @property
+    def props(self):
+        return self.feature("props")
+
+    def lines(self):
+        """Return the sentence as CoNLL lines (without line terminators)."""
+        return self.comments + ["\t".join(cols) for cols in self.rows]
+
+
+def read_sentences(filename, as_format=None):
+    """
+    Stream a CoNLL-X/CoNLL-U file sentence by sentence. Lines are split into columns once, comment lines
+    are kept apart from the token rows, and a final sentence without trailing blank line is still returned.
+    With as_format ('conll' or 'conllu'), the FEATS separators are rewritten on the fly (see conll_view).
+    """
+    if as_format is not None:
+        from conll_view import iter_view_lines
+        yield from iter_sentences(iter_view_lines(filename, as_format))
+        return
+    with open_file(filename) as f:
+        yield from iter_sentences(f)
+
+
+def _split_row(line):
+    # Sentences kept in memory share one copy of every distinct FEATS string
+    cols = line.split("\t")
+    if len(cols) > FEATS:
+        cols[FEATS] = sys.intern(cols[FEATS])
+    return cols
+
+
+def iter_sentences(lines):
+    """Group an iterable of CoNLL lines into Sentence objects."""
+    index = 1
+    rows = []
+    comments = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if rows:
+                yield Sentence(index, rows, comments)
+                index += 1
+            rows = []
+            comments = []
+        elif line.startswith("#"):
+            comments.append(line)
+        else:
+            rows.append(_split_row(line))
+    if rows:
+        yield Sentence(index, rows, comments)
+
+
+def read_sentence_spans(filename):
+    """
+    Like read_sentences, but yield (start, end, sentence) tuples where start..end is the byte range of the
+    sentence's lines in the file (without the blank separator line), so that it can be copied or sought to later.
+    """
+    with open_file(filename, "rb") as f:
+        index = 1
+        rows = []
+        comments = []
+        start = None
+        offset = 0
+        for raw_line in f:
+            line = raw_line.decode("utf-8").rstrip("\r\n")
+            if not line.strip():
+                if rows:
+                    yield start, offset, Sentence(index, rows, comments)
+                    index += 1
+                rows = []
+                comments = []
+                start = None
+            else:
+                if start is None:
+                    start = offset
+                if line.startswith("#"):
+                    comments.append(line)
+                else:
+                    rows.append(_split_row(line))
+            offset += len(raw_line)
+        if rows:
+            yield start, offset, Sentence(index, rows, comments)
+
+
+def write_sentence(f, sentence):
+    """Write a sentence followed by the blank separator line."""
+    for line in sentence.lines():
+        f.write(line + "\n")
+    f.write("\n")
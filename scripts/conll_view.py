@@ -0,0 +1,104 @@
+import argparse
+import sys
+
+import numpy as np
+
+from compressed_io import open_file
+
+CONLLX = "conll"
+CONLLU = "conllu"
+FORMATS = [CONLLX, CONLLU]
+
+CHUNK_SIZE = 1 << 20
+_TAB, _NEWLINE, _PIPE, _COLON, _EQUALS = (ord(c) for c in "\t\n|:=")
+
+
+def detect_format(path):
+    """Guess whether a file uses the CoNLL-X ('order:') or CoNLL-U ('order=') FEATS separator."""
+    with open_file(path, "rb") as f:
+        for line in f:
+            cols = line.split(b"\t")
+            if len(cols) > 5:
+                feats = cols[5]
+                colon = feats.find(b":")
+                equals = feats.find(b"=")
+                if equals != -1 and (colon == -1 or equals < colon):
+                    return CONLLU
+                return CONLLX
+    return CONLLX
+
+
+def _feats_mask(buf):
+    """Return a boolean mask of the bytes that belong to the FEATS (6th) column of their line."""
+    is_tab = buf == _TAB
+    tabs = np.cumsum(is_tab, dtype=np.int32)
+    # Number of tabs before the start of each byte's line (the running tab count is non-decreasing)
+    newlines = np.flatnonzero(buf == _NEWLINE)
+    tabs_before_line = np.zeros(len(buf), dtype=tabs.dtype)
+    tabs_before_line[newlines] = tabs[newlines]
+    tabs_before_line = np.maximum.accumulate(tabs_before_line)
+    return (tabs - tabs_before_line == 5) & ~is_tab
+
+
+def convert_chunk(data, to_format):
+    """
+    Rewrite the FEATS separators of a chunk of complete CoNLL lines. To CoNLL-U, every ':' in FEATS becomes '=' (as
+    in conversions.conll2conllu); to CoNLL-X, the first '=' of every '|'-separated FEATS item becomes ':'.
+    The rewrite works on the raw bytes of the whole chunk, without splitting lines into columns.
+    """
+    if not data:
+        return data
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+    in_feats = _feats_mask(buf)
+
+    if to_format == CONLLU:
+        buf[in_feats & (buf == _COLON)] = _EQUALS
+    else:
+        # Items start after a tab or '|'; keep the first '=' of each item
+        item_ids = np.cumsum((buf == _TAB) | (buf == _PIPE) | (buf == _NEWLINE), dtype=np.int32)
+        equals = np.flatnonzero(in_feats & (buf == _EQUALS))
+        _, first = np.unique(item_ids[equals], return_index=True)
+        buf[equals[first]] = _COLON
+    return buf.tobytes()
+
+
+def iter_view_chunks(path, as_format, chunk_size=CHUNK_SIZE):
+    """Stream a CoNLL file as raw byte chunks in the requested format, converting on the fly if needed."""
+    convert = detect_format(path) != as_format
+    with open_file(path, "rb") as f:
+        rest = b""
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                rest = block
+                continue
+            chunk, rest = block[:cut], block[cut:]
+            yield convert_chunk(chunk, as_format) if convert else chunk
+        if rest:
+            yield convert_chunk(rest, as_format) if convert else rest
+
+
+def iter_view_lines(path, as_format):
+    """Stream the lines (as text, with line endings) of a CoNLL file in the requested format."""
+    for chunk in iter_view_chunks(path, as_format):
+        yield from chunk.decode("utf-8").splitlines(keepends=True)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Stream a CoNLL file as CoNLL-X or CoNLL-U.")
+    argparser.add_argument("conll_file", type=str)
+    argparser.add_argument("--as", dest="as_format", choices=FORMATS, default=CONLLU)
+    argparser.add_argument("--output", "-o", type=str, default=None)
+    args = argparser.parse_args()
+
+    out = open_file(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_view_chunks(args.conll_file, args.as_format):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
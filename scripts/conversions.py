@@ -1,171 +1,235 @@
+import argparse
 import csv
-import sys
 
+from compressed_io import open_file
+from conll_reader import read_sentences
+from conll_view import CONLLU, iter_view_chunks
+from profiler import Profiler, profile_path
 
-def conll2tsv(conll_file: str, tsv_file: str):
+TSV_HEADER = ["Word Order", "Other Properties", "Subject Position", "Object Position", "Sentence"]
+
+
+def conll2tsv(conll_file: str, tsv_file: str, profiler=None):
     """
     This function converts conll files into the corresponding tsv representation.
     See examples for this in the Dutch and German gold folders.
     """
+    with open_file(tsv_file, "w") as tsv:
+        tsv_writer = csv.writer(tsv, delimiter="\t")
+        tsv_writer.writerow(TSV_HEADER)
+
+        sentences = read_sentences(conll_file)
+        convert = conll_to_tsv_row
+        write = tsv_writer.writerow
+        if profiler is not None:
+            sentences = profiler.iterate(sentences, "read")
+            convert = profiler.wrap(convert, "convert")
+            write = profiler.wrap(write, "write")
+        for sentence in sentences:
+            write(convert(sentence))
+
+
+def conll_to_tsv_row(sentence):
+    """Return the tsv row of a sentence: word order, props, subject and object position and the sentence text."""
     ID = 0
     TOKEN = 1
-    PROPS = 5
     SYN_ROLE = 7
 
-    with open(conll_file) as conll, open(tsv_file, "w") as tsv:
-        tsv_writer = csv.writer(tsv, delimiter="\t")
-        header = ["Word Order", "Other Properties", "Subject Position", "Object Position", "Sentence"]
-        tsv_writer.writerow(header)
-
-        sent_out = []
-        subj_pos = None
-        obj_pos = None
-        sentence = ""
-
-        for line in conll.readlines():
-            line = line.strip()
-            # If an empty line is found, the old sentence is written to the file
-            # and the sentence data is reset.
-            if not line:
-                sent_out.extend([subj_pos, obj_pos, sentence.rstrip()])
-                tsv_writer.writerow(sent_out)
-                sent_out = []
-                sentence = ""
-                subj_pos = None
-                obj_pos = None
-
-            else:
-                # Add properties to new TSV file.
-                line = line.split("\t")
-                if not sentence:
-                    props = line[PROPS].split("|")
-                    word_order = props[0].split(":")[1]
-                    other_props = props[1].split(":")[1]
-                    sent_out.extend([word_order, other_props])
-
-                # Determine Subject and Object Position
-                if line[SYN_ROLE] == "nsubj":
-                    subj_pos = line[ID]
-                if line[SYN_ROLE] == "obj":
-                    obj_pos = line[ID]
-
-                # Extend sentence by next token.
-                sentence += line[TOKEN] + " "
+    # Determine Subject and Object Position
+    subj_pos = None
+    obj_pos = None
+    for line in sentence.rows:
+        if line[SYN_ROLE] == "nsubj":
+            subj_pos = line[ID]
+        if line[SYN_ROLE] == "obj":
+            obj_pos = line[ID]
+
+    # Add properties and the sentence to new TSV file.
+    sentence_str = " ".join(line[TOKEN] for line in sentence.rows)
+    return [sentence.order, sentence.props, subj_pos, obj_pos, sentence_str]
+
+
+VERB_SECOND_ORDERS = ["VF[S]LK[V]MF[O]", "VF[O]LK[V]MF[S]", "VF[ADV]LK[V]MF[SO]", "VF[ADV]LK[V]MF[OS]"]
+VERB_FIRST_ORDERS = ["LK[V]MF[SO]", "LK[V]MF[OS]"]
+VERB_LAST_ORDERS = ["MF[SO]VC[V]", "MF[OS]VC[V]"]
+LANGUAGES = ["de", "nl"]
+
+# Arguments spanning two tokens, which push the verb one position further
+LONGER_ARGS = frozenset({"Staf", "Han", "Essent", "NPO", "Bertolt", "Günter"})
+DUTCH_KOPJES = frozenset({"kopje", "kopjes"})
+
+# Verb position anchors: the verb follows the subject/object, is the last or second to last word, or is fixed
+SUBJ, OBJ, LAST, FIXED = "subj", "obj", "last", "fixed"
+NO_RELATION = "_\t_"
+
+
+def _compile_verb_rules():
+    """
+    Build the verb position table: (word order, has aux, language) -> (anchor, offset, exceptions), where every
+    exception (argument, words, lowercase, only with psy) moves the verb one further position when the argument's
+    word is in words.
+    """
+    rules = {}
+    for language in LANGUAGES:
+        for word_order in VERB_SECOND_ORDERS + VERB_FIRST_ORDERS:
+            rules[(word_order, True, language)] = (LAST, 0, ())
+        for word_order in VERB_LAST_ORDERS:
+            # The German auxiliary follows the participle, the Dutch one precedes it
+            rules[(word_order, True, language)] = (LAST, 0 if language == "nl" else -1, ())
+            rules[(word_order, False, language)] = (LAST, 0, ())
+
+        # TODO: For psy OVS orders (not aux), the koffie exception also holds
+        rules[("VF[S]LK[V]MF[O]", False, language)] = (SUBJ, 1, ((SUBJ, LONGER_ARGS, False, False),))
+        obj_exceptions = ((OBJ, LONGER_ARGS, False, True),)
+        if language == "nl":
+            obj_exceptions = ((OBJ, DUTCH_KOPJES, True, False),) + obj_exceptions
+        rules[("VF[O]LK[V]MF[S]", False, language)] = (OBJ, 1, obj_exceptions)
+        for word_order in ("VF[ADV]LK[V]MF[SO]", "VF[ADV]LK[V]MF[OS]"):
+            rules[(word_order, False, language)] = (FIXED, 2, ())
+        for word_order in VERB_FIRST_ORDERS:
+            rules[(word_order, False, language)] = (FIXED, 1, ())
+    return rules
+
+
+VERB_RULES = _compile_verb_rules()
 
 
 def get_verb_pos(word_order, subj_pos, obj_pos, words, props, language="de"):
     has_aux = "aux" in props
-    is_psy = "psy" in props
-    longer_args = {"Staf", "Han", "Essent", "NPO", "Bertolt", "Günter"}
-    dutch_kopjes = {"kopje", "kopjes"}
-
-    last_idx = len(words)
-    last_word_idx = last_idx - 1
-    penultimate_word_idx = last_word_idx - 1
-
-    if has_aux:
-        if word_order in {
-            "VF[S]LK[V]MF[O]",
-            "VF[O]LK[V]MF[S]",
-            "VF[ADV]LK[V]MF[SO]",
-            "VF[ADV]LK[V]MF[OS]",
-            "LK[V]MF[SO]",
-            "LK[V]MF[OS]"
-        }:
-            return last_word_idx
-        elif word_order in {"MF[SO]VC[V]", "MF[OS]VC[V]"}:
-            if language == "nl":
-                return last_word_idx
-            else:
-                return penultimate_word_idx
-        else:
+    rule = VERB_RULES.get((word_order, has_aux, "nl" if language == "nl" else "de"))
+    if rule is None:
+        if has_aux:
             raise ValueError(f"Unknown word order pattern with aux: {word_order}")
+        raise ValueError(f"Unknown word order pattern: {word_order}")
 
-    # TODO: For psy OVS orders (not aux), the koffie exception also holds
+    anchor, offset, exceptions = rule
+    if anchor == LAST:
+        return len(words) - 1 + offset
+    if anchor == FIXED:
+        return offset
 
-    # --- Regular (non-aux or Dutch) logic ---
-    if word_order == "VF[S]LK[V]MF[O]":
-        subject_word = words[subj_pos - 1] if subj_pos - 1 < len(words) else ""
-        if subject_word in longer_args:
-            return subj_pos + 2
-        return subj_pos + 1
+    position = subj_pos if anchor == SUBJ else obj_pos
+    for argument, exception_words, lowercase, only_psy in exceptions:
+        if only_psy and "psy" not in props:
+            continue
+        arg_pos = subj_pos if argument == SUBJ else obj_pos
+        word = words[arg_pos - 1] if arg_pos - 1 < len(words) else ""
+        if (word.lower() if lowercase else word) in exception_words:
+            return position + offset + 1
+    return position + offset
 
-    elif word_order == "VF[O]LK[V]MF[S]":
-        obj_word = words[obj_pos - 1] if obj_pos - 1 < len(words) else ""
 
-        # Dutch exception: kopje/kopjes
-        if language == "nl" and obj_word.lower() in dutch_kopjes:
-            return obj_pos + 2
+def _tsv_length(row):
+    return len(row['Sentence'].split())
 
-        if is_psy and obj_word in longer_args:
-            return obj_pos + 2
-        return obj_pos + 1
 
-    elif word_order in ("VF[ADV]LK[V]MF[SO]", "VF[ADV]LK[V]MF[OS]"):
-        return 2
-    elif word_order in ("LK[V]MF[SO]", "LK[V]MF[OS]"):
-        return 1
-    elif word_order in ("MF[SO]VC[V]", "MF[OS]VC[V]"):
-        return last_word_idx
-    else:
-        raise ValueError(f"Unknown word order pattern: {word_order}")
+def _write_buffers(files, buffers):
+    for f_out, buffer in zip(files, buffers):
+        f_out.write("".join(buffer))
+        buffer.clear()
 
 
-def tsv2conll(input_path, output_path, format="conll", language="de"):
+def tsv2conll_multi(input_path, outputs, language="de", batch_size=1024, profiler=None):
     """
-    This function converts tsv files into the corresponding conll representation.
-    See examples for this in the Dutch and German gold folders.
-
+    Convert a tsv file into several conll representations in one pass. outputs maps a format ('conll' or
+    'conllu') to its output path. Token lines are collected in batches of batch_size sentences and written in bulk.
     """
-    if format not in {"conll", "conllu"}:
-        raise ValueError("format must be either 'conll' or 'conllu'")
-
-    with open(input_path, encoding='utf-8') as f_in, open(output_path, 'w', encoding='utf-8') as f_out:
-        reader = csv.DictReader(f_in, delimiter='\t')
-
-        for row in reader:
-            word_order = row['Word Order']
-            props = row['Other Properties']
-            subj_pos = int(row['Subject Position'])
-            obj_pos = int(row['Object Position'])
-            words = row['Sentence'].strip().split()
+    for format in outputs:
+        if format not in {"conll", "conllu"}:
+            raise ValueError("format must be either 'conll' or 'conllu'")
+
+    formats = list(outputs)
+    separators = tuple("=" if format == "conllu" else ":" for format in formats)
+    metadata_cache = {}
+    files = [open_file(outputs[format], 'w') for format in formats]
+    buffers = [[] for _ in formats]
+
+    try:
+        with open_file(input_path) as f_in:
+            reader = csv.DictReader(f_in, delimiter='\t')
+            convert = tsv_row_to_conll
+            write = _write_buffers
+            if profiler is not None:
+                reader = profiler.iterate(reader, "read", _tsv_length)
+                convert = profiler.wrap(convert, "convert")
+                write = profiler.wrap(write, "write")
+
+            for n_rows, row in enumerate(reader, 1):
+                for buffer, lines in zip(buffers, convert(row, separators, language, metadata_cache)):
+                    buffer.extend(lines)
+                    buffer.append("\n")
+
+                if n_rows % batch_size == 0:
+                    write(files, buffers)
+
+        write(files, buffers)
+    finally:
+        for f_out in files:
+            f_out.close()
+
+
+def tsv_row_to_conll(row, separators=(":",), language="de", metadata_cache=None):
+    """
+    Return the CoNLL token lines (with line terminators) of a tsv row, a dict of the tsv header fields, once for
+    every FEATS separator (':' for CoNLL-X, '=' for CoNLL-U). metadata_cache memoizes the FEATS per order and props.
+    """
+    word_order = row['Word Order']
+    props = row['Other Properties']
+    subj_pos = int(row['Subject Position'])
+    obj_pos = int(row['Object Position'])
+    words = row['Sentence'].strip().split()
 
-            sep = "=" if format == "conllu" else ":"
-            metadata = f"order{sep}{word_order}|props{sep}{props}"
+    if metadata_cache is None:
+        metadata_cache = {}
+    metadata = metadata_cache.get((word_order, props, separators))
+    if metadata is None:
+        metadata = metadata_cache[(word_order, props, separators)] = [
+            f"\t_\t_\t_\torder{sep}{word_order}|props{sep}{props}\t" for sep in separators]
 
-            verb_pos = get_verb_pos(word_order, subj_pos, obj_pos, words, props, language)
+    verb_pos = get_verb_pos(word_order, subj_pos, obj_pos, words, props, language)
+    verb_head = str(verb_pos)
+    # Later entries win: the verb before the subject before the object
+    relations = {obj_pos: f"{verb_head}\tobj", subj_pos: f"{verb_head}\tnsubj", verb_pos: "0\tverb"}
 
-            for idx, word in enumerate(words):
-                token_id = idx + 1
-                head = "_"
-                dep = "_"
+    return [[f"{token_id}\t{word}{meta}{relations.get(token_id, NO_RELATION)}\t_\t_\n"
+             for token_id, word in enumerate(words, 1)] for meta in metadata]
 
-                if token_id == verb_pos:
-                    head = "0"
-                    dep = "verb"
-                elif token_id == subj_pos:
-                    head = str(verb_pos)
-                    dep = "nsubj"
-                elif token_id == obj_pos:
-                    head = str(verb_pos)
-                    dep = "obj"
 
-                f_out.write(f"{token_id}\t{word}\t_\t_\t_\t{metadata}\t{head}\t{dep}\t_\t_\n")
-            f_out.write("\n")
+def tsv2conll(input_path, output_path, format="conll", language="de", profiler=None):
+    """
+    This function converts tsv files into the corresponding conll representation.
+    See examples for this in the Dutch and German gold folders.
 
+    """
+    tsv2conll_multi(input_path, {format: output_path}, language, profiler=profiler)
 
-def conll2conllu(input_path: str, output_path: str):
-    with open(input_path, encoding="utf-8") as f_in, open(output_path, "w", encoding="utf-8") as f_out:
-        for line in f_in:
-            if line.strip() == "":
-                f_out.write("\n")
-                continue
 
-            columns = line.rstrip("\n").split("\t")
-            if len(columns) >= 6:
-                columns[5] = columns[5].replace(":", "=")
-            f_out.write("\t".join(columns) + "\n")
+def conll2conllu(input_path: str, output_path: str, profiler=None):
+    """
+    Materialize the CoNLL-U version of a CoNLL-X file. Tools that only read the CoNLL-U version can stream it
+    instead with conll_view.iter_view_chunks or read_sentences(path, as_format="conllu").
+    """
+    with open_file(output_path, "wb") as f_out:
+        chunks = iter_view_chunks(input_path, CONLLU)
+        write = f_out.write
+        if profiler is not None:
+            chunks = profiler.iterate(chunks, "read+convert", size=None)
+            write = profiler.wrap(write, "write")
+        for chunk in chunks:
+            write(chunk)
 
 
 if __name__ == "__main__":
-    conll2tsv(sys.argv[1], sys.argv[2])
+    argparser = argparse.ArgumentParser(description="Convert a CoNLL file into its tsv representation.")
+    argparser.add_argument("conll_file", type=str)
+    argparser.add_argument("tsv_file", type=str)
+    argparser.add_argument("--profile", action="store_true",
+                           help="Time reading, conversion and writing; written to <tsv_file>.profile.json.")
+    args = argparser.parse_args()
+
+    if args.profile:
+        with Profiler() as profiler:
+            conll2tsv(args.conll_file, args.tsv_file, profiler)
+        profiler.write(profile_path(args.tsv_file))
+    else:
+        conll2tsv(args.conll_file, args.tsv_file)
@@ -0,0 +1,196 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from compressed_io import open_file
+from conll_reader import cached_feats
+from encoded_corpus import EncodedCorpus, Vocab, encode_bytes
+
+CACHE_DIRNAME = ".sorts_cache"
+# Bump for changes to the layout of the cache directory; changes to the encoder are detected from its source
+CACHE_VERSION = 1
+# Key of the builder fingerprint in derived .npz files
+BUILDER_KEY = "_builder"
+
+ARRAYS = ["sent_offsets", "token_offsets", "n_columns", "ids", "heads", "form_codes", "deprel_codes", "feats_codes",
+          "order_codes", "props_codes"]
+VOCABS = ["form_vocab", "deprel_vocab", "feats_vocab", "order_vocab", "props_vocab"]
+
+
+def cache_path(filename):
+    """Return the cache directory of a corpus file: <dir>/.sorts_cache/<basename>/"""
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIRNAME, basename)
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def source_fingerprint(*objects):
+    """Return a hash of the source of the modules defining the given functions or classes (or of given modules)."""
+    modules = dict.fromkeys(inspect.getmodule(obj) for obj in objects)
+    return content_hash("\n".join(inspect.getsource(module) for module in modules).encode("utf-8"))
+
+
+def encoder_fingerprint():
+    """Return a hash of the encoding code, so that caches are rebuilt whenever it changes."""
+    return source_fingerprint(encode_bytes, cached_feats)
+
+
+def _valid(meta):
+    return meta is not None and meta.get("version") == CACHE_VERSION and meta.get("encoder") == encoder_fingerprint()
+
+
+def file_hash(filename):
+    """
+    Return the content hash of a file. The hash recorded in the corpus cache is reused while the file's size and
+    mtime still match it.
+    """
+    stat = os.stat(filename)
+    meta = _read_meta(cache_path(filename))
+    if meta is not None and meta.get("size") == stat.st_size and meta.get("mtime_ns") == stat.st_mtime_ns:
+        return meta["sha1"]
+    with open_file(filename, "rb") as f:
+        return content_hash(f.read())
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, "meta.json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(cache_dir, "meta.json"))
+
+
+def _load(filename, cache_dir, meta):
+    """Return the cached EncodedCorpus, or None if any of its files is missing or unreadable."""
+    try:
+        arrays = {name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode="r") for name in ARRAYS}
+        vocabs = {name: Vocab(meta["vocabs"][name]) for name in VOCABS}
+    except (OSError, ValueError, EOFError, KeyError, TypeError):
+        return None
+    return EncodedCorpus(path=filename, **arrays, **vocabs)
+
+
+def _store(corpus, cache_dir, meta):
+    # Write into a temporary directory next to the cache, meta.json last, and swap it into place, so that readers
+    # and concurrent writers never see a partially written cache
+    parent = os.path.dirname(cache_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", suffix=".tmp", dir=parent)
+    old_dir = None
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, name + ".npy"), getattr(corpus, name))
+        meta["vocabs"] = {name: getattr(corpus, name).items for name in VOCABS}
+        _write_meta(tmp_dir, meta)
+        if os.path.isdir(cache_dir):
+            old_dir = tmp_dir + ".old"
+            try:
+                os.rename(cache_dir, old_dir)
+            except FileNotFoundError:
+                old_dir = None
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            # Another process stored the corpus in the meantime
+            if _read_meta(cache_dir) is None:
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def load_corpus(filename, use_cache=True):
+    """
+    Return the EncodedCorpus of a CoNLL file. With use_cache, the arrays are memory-mapped from the cache next to
+    the file, which is rebuilt whenever the file's size and content hash no longer match. The hash is only
+    recomputed when size or mtime changed.
+    """
+    if not use_cache:
+        with open_file(filename, "rb") as f:
+            return encode_bytes(f.read(), path=filename)
+
+    stat = os.stat(filename)
+    cache_dir = cache_path(filename)
+    meta = _read_meta(cache_dir)
+    if _valid(meta) and meta.get("size") == stat.st_size:
+        if meta.get("mtime_ns") == stat.st_mtime_ns:
+            corpus = _load(filename, cache_dir, meta)
+            if corpus is not None:
+                return corpus
+
+    with open_file(filename, "rb") as f:
+        data = f.read()
+    digest = content_hash(data)
+
+    if _valid(meta) and meta.get("sha1") == digest:
+        corpus = _load(filename, cache_dir, meta)
+        if corpus is not None:
+            # Touched but unchanged file: refresh the recorded mtime and keep the cache
+            meta["mtime_ns"] = stat.st_mtime_ns
+            try:
+                _write_meta(cache_dir, meta)
+            except OSError as e:
+                print(f"[WARNING] Could not write cache for {filename}: {e}")
+            return corpus
+
+    corpus = encode_bytes(data, path=filename)
+    meta = {"version": CACHE_VERSION, "encoder": encoder_fingerprint(), "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns, "sha1": digest}
+    try:
+        _store(corpus, cache_dir, meta)
+    except OSError as e:
+        print(f"[WARNING] Could not write cache for {filename}: {e}")
+    return corpus
+
+
+def load_derived(filename, name, build, use_cache=True, depends=()):
+    """
+    Return the corpus of a file and a dict of arrays derived from it by build(corpus), stored as <name>.npz in
+    its cache directory.
+    The cache directory is cleared whenever the corpus is re-encoded. The stored file is also rebuilt whenever the
+    source of the module of build, or of the modules of the functions in depends, changes.
+    """
+    corpus = load_corpus(filename, use_cache)
+    if not use_cache:
+        return corpus, build(corpus)
+
+    path = os.path.join(cache_path(filename), name + ".npz")
+    builder = source_fingerprint(build, *depends)
+    if os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if BUILDER_KEY in data.files and str(data[BUILDER_KEY]) == builder:
+                    return corpus, {key: data[key] for key in data.files if key != BUILDER_KEY}
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # Unreadable: rebuild it
+            pass
+
+    arrays = build(corpus)
+    try:
+        # Written under a temporary name and renamed, so that a partially written file is never read
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays, **{BUILDER_KEY: np.array(builder)})
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARNING] Could not write {name} cache for {filename}: {e}")
+    return corpus, arrays
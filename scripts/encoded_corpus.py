@@ -0,0 +1,292 @@
+import io
+
+import numpy as np
+
+from compressed_io import is_compressed, open_file
+from conll_reader import DEPREL, FEATS, FORM, HEAD, ID, cached_feats, iter_sentences
+
+NO_VALUE = -1
+INVALID = -2
+
+_WHITESPACE = np.frombuffer(b" \t\r\n", dtype=np.uint8)
+
+
+class Vocab:
+    """Interns strings to consecutive integer codes."""
+    __slots__ = ("index", "items")
+
+    def __init__(self, items=()):
+        self.index = {}
+        self.items = []
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        code = self.index.get(item)
+        if code is None:
+            code = self.index[item] = len(self.items)
+            self.items.append(item)
+        return code
+
+    def code(self, item):
+        return self.index.get(item, NO_VALUE)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class EncodedCorpus:
+    """
+    Columnar representation of a CoNLL file: token columns as flat integer arrays, sentences as offsets into them
+    and sentence-level order/props annotations as codes. token_offsets holds the byte offset of every token line
+    in the source file.
+    """
+
+    def __init__(self, sent_offsets, token_offsets, n_columns, ids, heads, form_codes, form_vocab,
+                 deprel_codes, deprel_vocab, feats_codes, feats_vocab, order_codes, order_vocab,
+                 props_codes, props_vocab, path=None):
+        self.sent_offsets = sent_offsets
+        self.token_offsets = token_offsets
+        self.n_columns = n_columns
+        self.ids = ids
+        self.heads = heads
+        self.form_codes = form_codes
+        self.form_vocab = form_vocab
+        self.deprel_codes = deprel_codes
+        self.deprel_vocab = deprel_vocab
+        self.feats_codes = feats_codes
+        self.feats_vocab = feats_vocab
+        self.order_codes = order_codes
+        self.order_vocab = order_vocab
+        self.props_codes = props_codes
+        self.props_vocab = props_vocab
+        self.path = path
+        self._parsed_feats = None
+        self._lists = {}
+        self._source_data = None
+
+    @property
+    def n_sentences(self):
+        return len(self.sent_offsets) - 1
+
+    @property
+    def n_tokens(self):
+        return int(self.sent_offsets[-1])
+
+    def sentence_lengths(self):
+        return np.diff(self.sent_offsets)
+
+    def token_sentences(self):
+        """Return the sentence number of every token."""
+        return np.repeat(np.arange(self.n_sentences, dtype=np.int32), self.sentence_lengths())
+
+    def deprel_mask(self, deprel):
+        code = self.deprel_vocab.code(deprel)
+        if code == NO_VALUE:
+            # A label that never occurs must not match the tokens without DEPREL
+            return np.zeros(self.n_tokens, dtype=bool)
+        return self.deprel_codes == code
+
+    def props_components(self):
+        """Return the props components (e.g. 'base', 'acc') of every props value in props_vocab order."""
+        return [props.split("-") if props else [] for props in self.props_vocab.items]
+
+    def props_matrix(self, components):
+        """
+        Return a boolean matrix telling which props value has which component, one row per props_vocab entry.
+        A trailing all-False row is added so that indexing it with NO_VALUE codes yields no components.
+        """
+        column = {component: i for i, component in enumerate(components)}
+        matrix = np.zeros((len(self.props_vocab) + 1, len(components)), dtype=bool)
+        for row, parts in enumerate(self.props_components()):
+            for part in parts:
+                if part in column:
+                    matrix[row, column[part]] = True
+        return matrix
+
+    def parsed_feats(self):
+        """Return the parsed FEATS dict of every feats_vocab entry, parsing each distinct string once."""
+        if self._parsed_feats is None:
+            self._parsed_feats = [cached_feats(feats) for feats in self.feats_vocab.items]
+        return self._parsed_feats
+
+    def as_list(self, name):
+        """Return a token array as a Python list, converted once, for cheap per-sentence slicing."""
+        values = self._lists.get(name)
+        if values is None:
+            values = self._lists[name] = getattr(self, name).tolist()
+        return values
+
+    def decoded(self, name, vocab, missing=None):
+        """Return a token code array decoded through its vocab, with missing for NO_VALUE codes."""
+        key = (name, missing)
+        values = self._lists.get(key)
+        if values is None:
+            items = vocab.items
+            values = self._lists[key] = [items[c] if c >= 0 else missing for c in self.as_list(name)]
+        return values
+
+    def forms(self, sentence):
+        start, end = self.sent_offsets[sentence], self.sent_offsets[sentence + 1]
+        return [self.form_vocab.items[code] for code in self.form_codes[start:end]]
+
+    def sentences(self, start=0, end=None):
+        """Iterate over the sentences start..end (0-based, end exclusive) as EncodedSentence views."""
+        offsets = self.sent_offsets.tolist()
+        end = self.n_sentences if end is None else min(end, self.n_sentences)
+        for i in range(start, end):
+            yield EncodedSentence(self, i + 1, offsets[i], offsets[i + 1])
+
+    def raw_rows(self, start, end):
+        """Read the token lines start..end back from the source file and split them into columns."""
+        rows = []
+        with self._open_source() as f:
+            for offset in self.token_offsets[start:end]:
+                f.seek(int(offset))
+                rows.append(f.readline().decode("utf-8").rstrip("\r\n").split("\t"))
+        return rows
+
+    def _open_source(self):
+        # A compressed source is decompressed once and kept, instead of on every call (see open_random_access)
+        if self._source_data is None:
+            if not is_compressed(self.path):
+                return open_file(self.path, "rb")
+            with open_file(self.path, "rb") as f:
+                self._source_data = f.read()
+        return io.BytesIO(self._source_data)
+
+
+class EncodedSentence:
+    """A view on one sentence of an EncodedCorpus, mirroring the reading interface of conll_reader.Sentence."""
+    __slots__ = ("corpus", "index", "start", "end")
+
+    def __init__(self, corpus, index, start, end):
+        self.corpus = corpus
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def forms(self):
+        corpus = self.corpus
+        return corpus.decoded("form_codes", corpus.form_vocab, "[MISSING]")[self.start:self.end]
+
+    @property
+    def rows(self):
+        return self.corpus.raw_rows(self.start, self.end)
+
+    def feats_strings(self):
+        corpus = self.corpus
+        return corpus.decoded("feats_codes", corpus.feats_vocab, "")[self.start:self.end]
+
+    def token_feats(self):
+        corpus = self.corpus
+        parsed = corpus.parsed_feats()
+        return [parsed[code] if code >= 0 else {} for code in corpus.as_list("feats_codes")[self.start:self.end]]
+
+    def feature(self, key):
+        for feats in self.token_feats():
+            value = feats.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def feature_values(self, key):
+        return [feats.get(key) for feats in self.token_feats()]
+
+    @property
+    def order(self):
+        code = self.corpus.order_codes[self.index - 1]
+        return self.corpus.order_vocab.items[code] if code >= 0 else None
+
+    @property
+    def props(self):
+        code = self.corpus.props_codes[self.index - 1]
+        return self.corpus.props_vocab.items[code] if code >= 0 else None
+
+
+def _to_int(value):
+    if value == "_":
+        return NO_VALUE
+    try:
+        return int(value)
+    except ValueError:
+        return INVALID
+
+
+def token_line_offsets(data):
+    """Return the byte offsets of all token lines (non-blank, non-comment) in the raw contents of a CoNLL file."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buf)]))
+    non_blank = np.concatenate(([0], np.cumsum(~np.isin(buf, _WHITESPACE))))
+    has_content = non_blank[ends] > non_blank[starts]
+    first = buf[np.minimum(starts, max(len(buf) - 1, 0))] if len(buf) else np.zeros(len(starts), dtype=np.uint8)
+    return starts[has_content & (first != ord("#"))].astype(np.int64)
+
+
+def encode_bytes(data, path=None):
+    """Encode the raw contents of a CoNLL file. HEADs that are '_' or missing are stored as NO_VALUE."""
+    form_vocab = Vocab()
+    deprel_vocab = Vocab()
+    feats_vocab = Vocab()
+    order_vocab = Vocab()
+    props_vocab = Vocab()
+
+    sent_offsets = [0]
+    n_columns = []
+    ids = []
+    heads = []
+    form_codes = []
+    deprel_codes = []
+    feats_codes = []
+    order_codes = []
+    props_codes = []
+
+    for sentence in iter_sentences(data.decode("utf-8").split("\n")):
+        for cols in sentence.rows:
+            n_cols = len(cols)
+            n_columns.append(n_cols)
+            ids.append(_to_int(cols[ID]))
+            heads.append(_to_int(cols[HEAD]) if n_cols > HEAD else NO_VALUE)
+            form_codes.append(form_vocab.add(cols[FORM]) if n_cols > FORM else NO_VALUE)
+            deprel_codes.append(deprel_vocab.add(cols[DEPREL]) if n_cols > DEPREL else NO_VALUE)
+            feats_codes.append(feats_vocab.add(cols[FEATS]) if n_cols > FEATS else NO_VALUE)
+        sent_offsets.append(len(ids))
+        order = sentence.order
+        props = sentence.props
+        order_codes.append(order_vocab.add(order) if order is not None else NO_VALUE)
+        props_codes.append(props_vocab.add(props) if props is not None else NO_VALUE)
+
+    token_offsets = token_line_offsets(data)
+    if len(token_offsets) != len(ids):
+        raise ValueError(f"found {len(token_offsets)} token lines but {len(ids)} tokens in {path}")
+
+    return EncodedCorpus(
+        np.array(sent_offsets, dtype=np.int64),
+        token_offsets,
+        np.array(n_columns, dtype=np.int16),
+        np.array(ids, dtype=np.int32),
+        np.array(heads, dtype=np.int32),
+        np.array(form_codes, dtype=np.int32),
+        form_vocab,
+        np.array(deprel_codes, dtype=np.int32),
+        deprel_vocab,
+        np.array(feats_codes, dtype=np.int32),
+        feats_vocab,
+        np.array(order_codes, dtype=np.int32),
+        order_vocab,
+        np.array(props_codes, dtype=np.int32),
+        props_vocab,
+        path=path,
+    )
+
+
+def encode_file(filename):
+    """Read a CoNLL file into an EncodedCorpus."""
+    with open_file(filename, "rb") as f:
+        return encode_bytes(f.read(), path=filename)
@@ -0,0 +1,151 @@
+import argparse
+import sys
+
+import numpy as np
+
+from conll_reader import PROPERTIES, WORD_ORDERS
+from corpus_cache import load_corpus
+from encoded_corpus import NO_VALUE
+from evaluate import check_alignment, known_classes
+from property_index import load_index
+
+# Sentence classes, from best to worst; a sentence gets the first class that applies
+CATEGORIES = ["correct", "swapped", "missing", "label_wrong", "head_wrong"]
+CORRECT, SWAPPED, MISSING, LABEL_WRONG, HEAD_WRONG = range(len(CATEGORIES))
+HEADER = ["Order", "Props", "Sentences"] + CATEGORIES
+
+
+def classify(gold, system):
+    """
+    Classify every sentence of a system file by how it handles the gold subject and object tokens:
+    swapped (a subject labelled obj and an object labelled nsubj), missing (a subject or object labelled neither),
+    label_wrong (any other wrong label), head_wrong (right labels, wrong attachment) or correct.
+    Returns an array of CATEGORIES codes over sentences.
+    """
+    check_alignment(gold, system)
+    token_sentences = gold.token_sentences()
+    gold_subj = gold.deprel_mask("nsubj")
+    gold_obj = gold.deprel_mask("obj")
+    system_subj = system.deprel_mask("nsubj")
+    system_obj = system.deprel_mask("obj")
+    scored = gold_subj | gold_obj
+
+    def any_token(mask):
+        return np.bincount(token_sentences, weights=mask, minlength=gold.n_sentences) > 0
+
+    conditions = [
+        any_token(gold_subj & system_obj) & any_token(gold_obj & system_subj),
+        any_token(scored & ~system_subj & ~system_obj),
+        any_token((gold_subj & ~system_subj) | (gold_obj & ~system_obj)),
+        any_token(scored & (system.heads != gold.heads)),
+    ]
+    return np.select(conditions, [SWAPPED, MISSING, LABEL_WRONG, HEAD_WRONG], CORRECT).astype(np.int8)
+
+
+def cross_tab(gold, categories):
+    """
+    Count the sentences of every category per word order x props component cell in one pass: a product of the
+    one-hot word order matrix and the one-hot props component x category matrix.
+    Returns (orders, props, counts[order, props, category]).
+    """
+    orders = known_classes(WORD_ORDERS, gold.order_vocab.items)
+    order_codes = np.array([gold.order_vocab.code(order) for order in orders], dtype=np.int32)
+    props = known_classes(PROPERTIES, [p for parts in gold.props_components() for p in parts])
+
+    order_members = ((gold.order_codes[:, None] == order_codes[None, :])
+                     & (gold.order_codes[:, None] != NO_VALUE)).astype(np.int64)
+    props_members = gold.props_matrix(props)[gold.props_codes]
+    category_members = categories[:, None] == np.arange(len(CATEGORIES))[None, :]
+    props_categories = (props_members[:, :, None] & category_members[:, None, :]).reshape(gold.n_sentences, -1)
+    counts = order_members.T @ props_categories.astype(np.int64)
+    return orders, props, counts.reshape(len(orders), len(props), len(CATEGORIES))
+
+
+def write_cross_tab(f, orders, props, counts):
+    """Write the non-empty cells of a cross tab as TSV rows matching HEADER."""
+    f.write("\t".join(HEADER) + "\n")
+    for i, order in enumerate(orders):
+        for j, prop in enumerate(props):
+            total = int(counts[i, j].sum())
+            if total:
+                f.write("\t".join([order, prop, str(total)] + [str(int(c)) for c in counts[i, j]]) + "\n")
+
+
+def write_pivot(f, orders, props, counts, category):
+    """Write the share of a category per cell as an order x props table (empty cells as '-')."""
+    totals = counts.sum(axis=2)
+    shown = [j for j in range(len(props)) if totals[:, j].any()]
+    f.write("\t".join([f"{category}"] + [props[j] for j in shown]) + "\n")
+    for i, order in enumerate(orders):
+        if not totals[i].any():
+            continue
+        cells = [f"{counts[i, j, CATEGORIES.index(category)] / totals[i, j]:.4f}" if totals[i, j] else "-"
+                 for j in shown]
+        f.write("\t".join([order] + cells) + "\n")
+
+
+def _role_forms(corpus, sentence, mask):
+    start, end = corpus.sent_offsets[sentence], corpus.sent_offsets[sentence + 1]
+    forms = corpus.forms(sentence)
+    return ",".join(forms[i] for i in np.flatnonzero(mask[start:end])) or "-"
+
+
+def write_samples(f, gold_file, gold, system, categories, n_samples, use_cache=True):
+    """
+    Write up to n_samples erroneous sentences per order x props component x category cell, looked up through the
+    property index of the gold file, with the gold and system subject and object of each.
+    """
+    index = load_index(gold_file, use_cache)
+    f.write("\t".join(["Order", "Props", "Category", "Sentence", "Gold S", "Gold O", "System S", "System O",
+                       "Text"]) + "\n")
+    roles = [(corpus, corpus.deprel_mask(deprel)) for corpus in (gold, system) for deprel in ("nsubj", "obj")]
+    props = sorted({p for parts in gold.props_components() for p in parts})
+    for category in range(1, len(CATEGORIES)):
+        category_bits = np.packbits(categories == category)
+        if not category_bits.any():
+            continue
+        for order in gold.order_vocab.items:
+            order_bits = index.lookup(f"order:{order}") & category_bits
+            for prop in props:
+                for sentence in index.sentence_ids(order_bits & index.lookup(f"prop:{prop}"))[:n_samples]:
+                    f.write("\t".join([order, prop, CATEGORIES[category], str(sentence + 1)]
+                                      + [_role_forms(corpus, sentence, mask) for corpus, mask in roles]
+                                      + [" ".join(gold.forms(sentence))]) + "\n")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Cross-tabulate subject/object errors by word order and props.")
+    argparser.add_argument("gold_file", type=str)
+    argparser.add_argument("system_file", type=str)
+    argparser.add_argument("--output", "-o", type=str, default=None)
+    argparser.add_argument("--pivot", choices=CATEGORIES, default=None,
+                           help="Write the share of one category as an order x props table instead.")
+    argparser.add_argument("--samples", type=int, default=0, help="Sample sentences per cell and error category.")
+    argparser.add_argument("--samples-output", type=str, default=None,
+                           help="File for the samples (default: after the table).")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    use_cache = not args.no_cache
+    gold = load_corpus(args.gold_file, use_cache)
+    system = load_corpus(args.system_file, use_cache)
+    categories = classify(gold, system)
+    orders, props, counts = cross_tab(gold, categories)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.pivot:
+            write_pivot(out, orders, props, counts, args.pivot)
+        else:
+            write_cross_tab(out, orders, props, counts)
+
+        if args.samples:
+            if args.samples_output:
+                with open(args.samples_output, "w", encoding="utf-8") as f:
+                    write_samples(f, args.gold_file, gold, system, categories, args.samples, use_cache)
+            else:
+                out.write("\n")
+                write_samples(out, args.gold_file, gold, system, categories, args.samples, use_cache)
+    finally:
+        if out is not sys.stdout:
+            out.close()
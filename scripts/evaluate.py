@@ -0,0 +1,223 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from conll_reader import PROPERTIES, WORD_ORDERS
+from corpus_cache import load_corpus
+from encoded_corpus import NO_VALUE
+
+ROLES = ['nsubj', 'obj']
+HEADER = ["Group", "Class", "Role", "Count", "Attachment", "Label", "Attachment+Label"]
+METRICS = ["attachment", "label", "both"]
+
+
+def check_alignment(gold, system):
+    """Raise a ValueError if the system file does not have the same sentences and token counts as the gold file."""
+    if gold.n_sentences != system.n_sentences:
+        raise ValueError(f"gold has {gold.n_sentences} sentences, system has {system.n_sentences}")
+    if not np.array_equal(gold.sent_offsets, system.sent_offsets):
+        sentence = int(np.flatnonzero(gold.sentence_lengths() != system.sentence_lengths())[0])
+        raise ValueError(f"token counts differ in sentence {sentence + 1}")
+
+
+def known_classes(known, seen):
+    """Return the README classes followed by any additional classes found in the data."""
+    return known + sorted(set(seen) - set(known))
+
+
+def group_members(gold):
+    """
+    Return the score groups (overall, per word order, per props component) as (group, class) pairs, together with
+    a boolean sentence x group membership matrix.
+    """
+    orders = known_classes(WORD_ORDERS, gold.order_vocab.items)
+    order_codes = np.array([gold.order_vocab.code(order) for order in orders], dtype=np.int32)
+    props = known_classes(PROPERTIES, [p for parts in gold.props_components() for p in parts if p != 'base'])
+
+    order_members = (gold.order_codes[:, None] == order_codes[None, :]) & (gold.order_codes[:, None] != NO_VALUE)
+    props_members = gold.props_matrix(props)[gold.props_codes]
+    members = np.hstack([np.ones((gold.n_sentences, 1), dtype=bool), order_members, props_members])
+    groups = [("all", "all")] + [("order", o) for o in orders] + [("props", p) for p in props]
+    return groups, members
+
+
+def score(gold, system):
+    """
+    Compute subject and object attachment and label accuracy of a system against gold, overall and broken down
+    by word order and props class. Returns a list of rows matching HEADER.
+    """
+    check_alignment(gold, system)
+    token_sentences = gold.token_sentences()
+    head_ok = system.heads == gold.heads
+    groups, sentence_members = group_members(gold)
+
+    rows = []
+    for role in ROLES:
+        tokens = np.flatnonzero(gold.deprel_mask(role))
+        correct = np.stack([
+            head_ok[tokens],
+            system.deprel_mask(role)[tokens],
+        ])
+        correct = np.vstack([correct, correct[0] & correct[1]]).astype(np.int64)
+
+        # One-hot group memberships of every scored token
+        members = sentence_members[token_sentences[tokens]]
+
+        counts = members.sum(axis=0)
+        hits = correct @ members
+        for (group, name), count, (head, label, both) in zip(groups, counts, hits.T):
+            rows.append([group, name, role, int(count)] + [_ratio(value, count) for value in (head, label, both)])
+
+    return rows
+
+
+def sentence_correct(gold, system):
+    """
+    Return a boolean array over sentences: True where the system attaches and labels every gold subject and object
+    token correctly.
+    """
+    check_alignment(gold, system)
+    head_ok = system.heads == gold.heads
+    wrong = np.zeros(gold.n_tokens, dtype=bool)
+    for role in ROLES:
+        wrong |= gold.deprel_mask(role) & ~(head_ok & system.deprel_mask(role))
+    return np.bincount(gold.token_sentences(), weights=wrong, minlength=gold.n_sentences) == 0
+
+
+def _role_counts(gold, system, role, metric):
+    """Return the number of correct gold tokens of a role per sentence for one of METRICS."""
+    tokens = np.flatnonzero(gold.deprel_mask(role))
+    if metric == "attachment":
+        correct = system.heads[tokens] == gold.heads[tokens]
+    elif metric == "label":
+        correct = system.deprel_mask(role)[tokens]
+    else:
+        correct = (system.heads[tokens] == gold.heads[tokens]) & system.deprel_mask(role)[tokens]
+    return np.bincount(gold.token_sentences()[tokens], weights=correct, minlength=gold.n_sentences)
+
+
+def bootstrap_weights(n_sentences, n_resamples, rng):
+    """Return a (n_resamples x n_sentences) matrix of how often each sentence is drawn in each resample."""
+    draws = rng.integers(0, n_sentences, size=(n_resamples, n_sentences))
+    draws += np.arange(n_resamples)[:, None] * n_sentences
+    counts = np.bincount(draws.ravel(), minlength=n_resamples * n_sentences)
+    return counts.reshape(n_resamples, n_sentences).astype(np.float32)
+
+
+def compare_systems(gold, systems, metric="both", n_resamples=1000, seed=0, confidence=0.95, block_size=250):
+    """
+    Score several systems against gold side by side. For every score group and role, returns the token count, the
+    accuracy of every system and a paired bootstrap confidence interval of every system's accuracy and of its
+    difference to the first system. Sentences are resampled (the same resamples for all systems), and every
+    resample is a row of a weight matrix, so all accuracies of a block of resamples are two matrix products.
+    Returns (groups, roles, counts[role, group], accuracy[system, role, group], intervals[system, role, group, 2],
+    differences[system, role, group, 2]).
+    """
+    for system in systems:
+        check_alignment(gold, system)
+    groups, members = group_members(gold)
+    members = members.astype(np.float32)
+
+    # Sentence x (role, group) token counts, and sentence x (system, role, group) correct counts
+    totals = np.stack([np.bincount(gold.token_sentences(), weights=gold.deprel_mask(role), minlength=gold.n_sentences)
+                       for role in ROLES]).astype(np.float32)
+    correct = np.stack([[_role_counts(gold, system, role, metric) for role in ROLES]
+                        for system in systems]).astype(np.float32)
+    denominators = (totals[:, :, None] * members[None]).transpose(1, 0, 2).reshape(gold.n_sentences, -1)
+    numerators = (correct[:, :, :, None] * members[None, None]).transpose(2, 0, 1, 3).reshape(gold.n_sentences, -1)
+
+    shape = (len(systems), len(ROLES), len(groups))
+    counts = denominators.sum(axis=0).reshape(shape[1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accuracy = numerators.sum(axis=0).reshape(shape) / counts[None]
+
+    rng = np.random.default_rng(seed)
+    samples = []
+    for start in range(0, n_resamples, block_size):
+        weights = bootstrap_weights(gold.n_sentences, min(block_size, n_resamples - start), rng)
+        sample_correct = (weights @ numerators).reshape((-1,) + shape)
+        sample_counts = (weights @ denominators).reshape((-1, 1) + shape[1:])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            samples.append(sample_correct / sample_counts)
+    samples = np.concatenate(samples) if samples else np.full((0,) + shape, np.nan)
+
+    # Groups without tokens (README classes missing from the file) get no interval
+    tail = (1 - confidence) / 2 * 100
+    percentiles = [tail, 100 - tail]
+    scored = counts > 0
+    intervals = np.full(shape + (2,), np.nan)
+    differences = np.full(shape + (2,), np.nan)
+    intervals[:, scored] = np.moveaxis(np.nanpercentile(samples[:, :, scored], percentiles, axis=0), 0, -1)
+    differences[:, scored] = np.moveaxis(
+        np.nanpercentile((samples - samples[:, :1])[:, :, scored], percentiles, axis=0), 0, -1)
+    return groups, ROLES, counts.astype(np.int64), accuracy, intervals, differences
+
+
+def write_comparison(f, names, comparison):
+    """Write the result of compare_systems as TSV: one row per group and role, one column block per system."""
+    groups, roles, counts, accuracy, intervals, differences = comparison
+    header = ["Group", "Class", "Role", "Count"]
+    for i, name in enumerate(names):
+        header += [name, f"{name} CI low", f"{name} CI high"]
+        if i > 0:
+            header += [f"{name} - {names[0]} CI low", f"{name} - {names[0]} CI high"]
+    f.write("\t".join(header) + "\n")
+
+    for r, role in enumerate(roles):
+        for g, (group, name) in enumerate(groups):
+            row = [group, name, role, int(counts[r, g])]
+            for s in range(len(names)):
+                row += [_round(v) for v in (accuracy[s, r, g], *intervals[s, r, g])]
+                if s > 0:
+                    row += [_round(v) for v in differences[s, r, g]]
+            f.write("\t".join("-" if v is None else str(v) for v in row) + "\n")
+
+
+def _round(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def _ratio(value, count):
+    return round(float(value) / count, 4) if count else None
+
+
+def write_table(f, rows, system=None, header=True):
+    """Write score rows as TSV, optionally prefixed by a system name column."""
+    if header:
+        f.write("\t".join(HEADER if system is None else ["System"] + HEADER) + "\n")
+    for row in rows:
+        values = row if system is None else [system] + row
+        f.write("\t".join("-" if v is None else str(v) for v in values) + "\n")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Score subject/object attachment and labels against gold.")
+    argparser.add_argument("gold_file", type=str)
+    argparser.add_argument("system_files", type=str, nargs="+")
+    argparser.add_argument("--output", "-o", type=str, default=None)
+    argparser.add_argument("--compare", action="store_true",
+                           help="Score all systems side by side with paired bootstrap confidence intervals.")
+    argparser.add_argument("--metric", choices=METRICS, default="both",
+                           help="Accuracy compared with --compare: attachment, label or both (default).")
+    argparser.add_argument("--resamples", type=int, default=1000, help="Bootstrap resamples for --compare.")
+    argparser.add_argument("--seed", type=int, default=0, help="Random seed of the bootstrap.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    use_cache = not args.no_cache
+    gold = load_corpus(args.gold_file, use_cache)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.compare:
+            systems = [load_corpus(system_file, use_cache) for system_file in args.system_files]
+            comparison = compare_systems(gold, systems, args.metric, args.resamples, args.seed)
+            write_comparison(out, [os.path.basename(system_file) for system_file in args.system_files], comparison)
+        else:
+            for i, system_file in enumerate(args.system_files):
+                rows = score(gold, load_corpus(system_file, use_cache))
+                write_table(out, rows, os.path.basename(system_file), header=(i == 0))
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from compressed_io import strip_compression
+from conll_reader import cached_feats
+from corpus_cache import CACHE_DIRNAME, file_hash, load_corpus, source_fingerprint
+from encoded_corpus import encode_bytes
+from evaluate import score, write_table
+
+SCORES_VERSION = 1
+GOLD_SUFFIX = "_gold.conll"
+
+
+def scorer_fingerprint():
+    """
+    Return a hash of the scoring code, so that memoized scores are dropped whenever it changes: the whole source
+    of evaluate.py, encoded_corpus.py and conll_reader.py (the PROPERTIES and WORD_ORDERS tables).
+    """
+    return source_fingerprint(score, encode_bytes, cached_feats)
+
+
+def find_pairs(roots):
+    """
+    Return the (gold, system) pairs of the given language folders (e.g. german, dutch): every
+    <root>/gold/<language>_<split>_gold.conll is paired with the files of all <root>/results*/ folders named
+    <language>_<split>_<system>.conll.
+    """
+    pairs = []
+    for root in roots:
+        gold_dir = os.path.join(root, "gold")
+        gold_files = sorted(os.path.join(gold_dir, f) for f in os.listdir(gold_dir)
+                            if strip_compression(f).endswith(GOLD_SUFFIX))
+        result_files = sorted(os.path.join(root, d, f)
+                              for d in os.listdir(root)
+                              if d.startswith("results") and os.path.isdir(os.path.join(root, d))
+                              for f in os.listdir(os.path.join(root, d))
+                              if strip_compression(f).endswith(".conll"))
+        for gold_file in gold_files:
+            prefix = strip_compression(os.path.basename(gold_file))[:-len(GOLD_SUFFIX)] + "_"
+            pairs.extend((gold_file, system_file) for system_file in result_files
+                         if os.path.basename(system_file).startswith(prefix))
+    return pairs
+
+
+def scores_path(filename):
+    """Return the path of the memoized scores of a system file: <dir>/.sorts_cache/<basename>.scores.json"""
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIRNAME, basename + ".scores.json")
+
+
+def load_scores(system_file):
+    try:
+        with open(scores_path(system_file), encoding="utf-8") as f:
+            scores = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return scores.get("entries", []) if scores.get("version") == SCORES_VERSION else []
+
+
+def save_scores(system_file, entries):
+    path = scores_path(system_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SCORES_VERSION, "entries": entries}, f)
+    os.replace(tmp_path, path)
+
+
+def _score_pair(task):
+    gold_file, system_file, use_cache = task
+    try:
+        return score(load_corpus(gold_file, use_cache), load_corpus(system_file, use_cache)), None
+    except (OSError, ValueError) as e:
+        return None, str(e)
+
+
+def _build_caches(filenames):
+    """
+    Encode and cache every file once, before the workers memory-map them, so that no two processes write the cache
+    of the same file at the same time.
+    """
+    for filename in dict.fromkeys(filenames):
+        try:
+            load_corpus(filename)
+        except (OSError, ValueError):
+            # Reported by the worker scoring the file
+            pass
+
+
+def evaluate_suite(pairs, jobs=None, use_cache=True):
+    """
+    Score every (gold, system) pair, scoring the pairs without memoized scores on a process pool. Scores are
+    memoized per system file, keyed on the content hashes of both files and the scorer fingerprint.
+    Returns a list of (gold, system, rows, error) in pair order, with the number of pairs served from the memo.
+    """
+    scorer = scorer_fingerprint()
+    results = [None] * len(pairs)
+    todo = []
+    memo = {}
+    for i, (gold_file, system_file) in enumerate(pairs):
+        if not use_cache:
+            todo.append((i, None))
+            continue
+        try:
+            key = {"gold": file_hash(gold_file), "system": file_hash(system_file), "scorer": scorer}
+        except OSError as e:
+            results[i] = (gold_file, system_file, None, str(e))
+            continue
+        entries = memo.setdefault(system_file, load_scores(system_file))
+        cached = next((e for e in entries if all(e.get(k) == v for k, v in key.items())), None)
+        if cached is not None:
+            results[i] = (gold_file, system_file, cached["rows"], cached.get("error"))
+        else:
+            todo.append((i, key))
+
+    if todo:
+        if use_cache:
+            _build_caches(f for i, _ in todo for f in pairs[i])
+        with multiprocessing.Pool(min(jobs or os.cpu_count() or 1, len(todo))) as pool:
+            tasks = [(pairs[i][0], pairs[i][1], use_cache) for i, _ in todo]
+            for (i, key), (rows, error) in zip(todo, pool.imap(_score_pair, tasks)):
+                gold_file, system_file = pairs[i]
+                results[i] = (gold_file, system_file, rows, error)
+                if use_cache:
+                    # Keep the scores of the current system file against other gold files
+                    entries = [e for e in memo[system_file] if e.get("system") == key["system"]
+                               and e.get("scorer") == scorer and e.get("gold") != key["gold"]]
+                    entries.append(dict(key, rows=rows, error=error))
+                    memo[system_file] = entries
+                    try:
+                        save_scores(system_file, entries)
+                    except OSError as e:
+                        print(f"[WARNING] Could not write scores for {system_file}: {e}")
+    return results, len(pairs) - len(todo)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Score all system files of the language folders against their "
+                                                    "gold files, reusing the scores of unchanged pairs.")
+    argparser.add_argument("roots", type=str, nargs="+", help="Language folders, e.g. german dutch.")
+    argparser.add_argument("--output", "-o", type=str, default=None)
+    argparser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes.")
+    argparser.add_argument("--no-cache", action="store_true",
+                           help="Do not read or write memoized scores or the binary corpus cache.")
+    args = argparser.parse_args()
+
+    start_time = time.perf_counter()
+    pairs = find_pairs(args.roots)
+    results, cached = evaluate_suite(pairs, args.jobs, not args.no_cache)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        header = True
+        for gold_file, system_file, rows, error in results:
+            if error is not None:
+                print(f"[WARNING] {system_file} against {gold_file}: {error}", file=sys.stderr)
+                continue
+            write_table(out, rows, os.path.basename(system_file), header=header)
+            header = False
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Scored {len(pairs)} pairs ({cached} from cache) in {time.perf_counter() - start_time:.2f}s",
+          file=sys.stderr)
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+from compressed_io import strip_compression
+from conll_reader import DEPREL, FEATS, HEAD, ID, LEMMA, XPOS, read_sentence_spans
+from corpus_cache import load_derived
+from join_layers import layer_fingerprint
+
+# Annotation layers hashed per sentence: lemmas, POS and FEATS other than order/props; HEAD and DEPREL of all
+# tokens; ID, HEAD and DEPREL of the subject and object tokens only. 0 means the file has no such columns.
+LAYERS = ["morph", "tree", "args"]
+MISSING = 0
+
+
+def _hash(text):
+    # Never MISSING
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def sentence_key(sentence):
+    """Return the stable identity of a sentence as uint64: its word order, props and ordered surface forms."""
+    return int.from_bytes(layer_fingerprint(sentence)[:8], "little")
+
+
+def layer_hashes(sentence):
+    """Return the hash of every LAYERS layer of a sentence."""
+    rows = sentence.rows
+    hashes = []
+    if all(len(cols) > FEATS for cols in rows):
+        hashes.append(_hash("\n".join(
+            "\t".join(cols[LEMMA:XPOS + 1] + [item for item in cols[FEATS].split("|")
+                                              if not item.startswith(("order", "props"))])
+            for cols in rows)))
+    else:
+        hashes.append(MISSING)
+    if all(len(cols) > DEPREL for cols in rows):
+        hashes.append(_hash("\n".join(f"{cols[HEAD]}\t{cols[DEPREL]}" for cols in rows)))
+        hashes.append(_hash("\n".join(f"{cols[ID]}\t{cols[HEAD]}\t{cols[DEPREL]}" for cols in rows
+                                      if cols[DEPREL] in ("nsubj", "obj"))))
+    else:
+        hashes.extend([MISSING, MISSING])
+    return hashes
+
+
+def build_fingerprint_arrays(corpus):
+    """Compute the sentence keys, byte offsets and layer hashes of every sentence of a corpus' source file."""
+    keys = []
+    offsets = []
+    layers = []
+    for start, _, sentence in read_sentence_spans(corpus.path):
+        keys.append(sentence_key(sentence))
+        offsets.append(start)
+        layers.append(layer_hashes(sentence))
+    return {"keys": np.array(keys, dtype=np.uint64), "offsets": np.array(offsets, dtype=np.int64),
+            "layers": np.array(layers, dtype=np.uint64).reshape(-1, len(LAYERS))}
+
+
+def _occurrences(keys):
+    """Return the occurrence number of every key among the equal keys before it (0 for the first)."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    group_starts = np.repeat(starts, np.diff(np.append(starts, len(keys))))
+    occurrences = np.empty(len(keys), dtype=np.int64)
+    occurrences[order] = np.arange(len(keys)) - group_starts
+    return occurrences
+
+
+class FingerprintStore:
+    """
+    Sentence fingerprints of a set of CoNLL files: for every file the key, byte offset and layer hashes of each
+    sentence, kept in the cache next to the file and only recomputed when the file changes. All files' keys are
+    merged into one sorted table, so finding where a sentence occurs is a binary search.
+    """
+
+    def __init__(self, files, use_cache=True):
+        self.files = list(files)
+        self.tables = [load_derived(f, "fingerprints", build_fingerprint_arrays, use_cache,
+                                    (layer_fingerprint, read_sentence_spans))[1] for f in self.files]
+        keys = [table["keys"] for table in self.tables]
+        self._keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint64)
+        self._file = np.repeat(np.arange(len(keys)), [len(k) for k in keys])
+        self._sentence = np.concatenate([np.arange(len(k)) for k in keys]) if keys else np.zeros(0, dtype=np.int64)
+        self._order = np.argsort(self._keys, kind="stable")
+        self._sorted = self._keys[self._order]
+
+    def table(self, filename):
+        return self.tables[self.files.index(filename)]
+
+    def locate(self, key):
+        """Return the (file, 0-based sentence number, byte offset) of every occurrence of a sentence key."""
+        key = np.uint64(key)
+        start = np.searchsorted(self._sorted, key, side="left")
+        end = np.searchsorted(self._sorted, key, side="right")
+        locations = []
+        for i in self._order[start:end]:
+            file_index, sentence = int(self._file[i]), int(self._sentence[i])
+            locations.append((self.files[file_index], sentence, int(self.tables[file_index]["offsets"][sentence])))
+        return locations
+
+    def shared(self):
+        """Return the number of sentence keys of every file that also occur in each other file, as a matrix."""
+        n = len(self.files)
+        counts = np.zeros((n, n), dtype=np.int64)
+        for i, table in enumerate(self.tables):
+            for j, other in enumerate(self.tables):
+                counts[i, j] = np.isin(table["keys"], other["keys"]).sum()
+        return counts
+
+    def match(self, file_a, file_b):
+        """
+        Pair the sentences of two files by key; sentences with the same key are paired in file order.
+        Returns (sentences of a, matching sentences of b), both 0-based, and the unmatched sentences of a and b.
+        """
+        a, b = self.table(file_a)["keys"], self.table(file_b)["keys"]
+        index_b = {key: i for i, key in enumerate(zip(b.tolist(), _occurrences(b).tolist()))}
+        matched_b = np.array([index_b.get(key, -1) for key in zip(a.tolist(), _occurrences(a).tolist())],
+                             dtype=np.int64)
+        found = matched_b >= 0
+        sentences_a = np.flatnonzero(found)
+        sentences_b = matched_b[found]
+        unmatched_b = np.setdiff1d(np.arange(len(b)), sentences_b)
+        return sentences_a, sentences_b, np.flatnonzero(~found), unmatched_b
+
+    def layer_diff(self, file_a, file_b, layer):
+        """Return the pairs of matching sentences (0-based) of two files whose hashes of a layer differ."""
+        column = LAYERS.index(layer)
+        sentences_a, sentences_b, _, _ = self.match(file_a, file_b)
+        hashes_a = self.table(file_a)["layers"][sentences_a, column]
+        hashes_b = self.table(file_b)["layers"][sentences_b, column]
+        if (hashes_a == MISSING).all() or (hashes_b == MISSING).all():
+            raise ValueError(f"Layer '{layer}' is missing in {file_a if (hashes_a == MISSING).all() else file_b}")
+        differ = hashes_a != hashes_b
+        return list(zip(sentences_a[differ].tolist(), sentences_b[differ].tolist()))
+
+    def misaligned(self, gold_file, system_file):
+        """Return the (0-based) sentence numbers at which a system file does not have the gold sentence."""
+        gold, system = self.table(gold_file)["keys"], self.table(system_file)["keys"]
+        n = min(len(gold), len(system))
+        return np.concatenate([np.flatnonzero(gold[:n] != system[:n]), np.arange(n, max(len(gold), len(system)))])
+
+
+def find_files(paths):
+    """Expand folders into the .conll files (also compressed) in them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if strip_compression(f).endswith(".conll")))
+        else:
+            files.append(path)
+    # A file given both directly and through its folder is stored once
+    return list(dict.fromkeys(os.path.normpath(f) for f in files))
+
+
+def _sentence_numbers(sentences):
+    return ", ".join(str(s + 1) for s in sentences[:20]) + (" ..." if len(sentences) > 20 else "")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Find sentences across files by fingerprint and compare files "
+                                                    "sentence by sentence.")
+    argparser.add_argument("paths", type=str, nargs="+", help="CoNLL files or folders of the store.")
+    argparser.add_argument("--find", type=int, default=None, metavar="SENTENCE",
+                           help="List all occurrences of a sentence (1-based) of the first file.")
+    argparser.add_argument("--diff", choices=LAYERS, default=None,
+                           help="List the sentences of the first file whose layer differs in the second.")
+    argparser.add_argument("--align", action="store_true",
+                           help="List the sentences at which the other files no longer align with the first.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    store = FingerprintStore(find_files(args.paths), not args.no_cache)
+    first = store.files[0]
+    if args.find is not None:
+        key = store.table(first)["keys"][args.find - 1]
+        for filename, sentence, offset in store.locate(key):
+            print(f"{filename}\tsentence {sentence + 1}\toffset {offset}")
+    elif args.diff:
+        for other in store.files[1:]:
+            sentences_a, _, unmatched_a, unmatched_b = store.match(first, other)
+            differ = store.layer_diff(first, other, args.diff)
+            print(f"{other}: {len(differ)} of {len(sentences_a)} matched sentences differ in {args.diff} "
+                  f"({_sentence_numbers([a for a, _ in differ])}); {len(unmatched_a)} and {len(unmatched_b)} "
+                  f"sentences unmatched")
+    elif args.align:
+        for other in store.files[1:]:
+            misaligned = store.misaligned(first, other)
+            print(f"{other}: {len(misaligned)} misaligned sentences ({_sentence_numbers(misaligned)})")
+    else:
+        for filename, row in zip(store.files, store.shared()):
+            print(f"{filename}\t{len(store.table(filename)['keys'])} sentences\t"
+                  + "\t".join(str(count) for count in row))
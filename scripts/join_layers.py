@@ -0,0 +1,101 @@
+import argparse
+import hashlib
+
+from compressed_io import open_file, open_random_access
+from conll_reader import FEATS, iter_sentences, read_sentence_spans, write_sentence
+
+
+def layer_fingerprint(sentence):
+    """Return a compact hash of the word order, props and the ordered surface forms of a sentence."""
+    key = "\x1f".join([sentence.order or "\x00", sentence.props or "\x00"] + sentence.forms)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _feats_key(item):
+    return item.split(":", 1)[0].split("=", 1)[0]
+
+
+def merge_feats(base, layer):
+    """Merge two FEATS strings item by item: all items of layer, then the items of base with a key layer lacks."""
+    if layer in ("", "_"):
+        return base
+    if base in ("", "_"):
+        return layer
+    items = layer.split("|")
+    keys = {_feats_key(item) for item in items}
+    items.extend(item for item in base.split("|") if _feats_key(item) not in keys)
+    return "|".join(items)
+
+
+def merge_rows(base_rows, layer_rows):
+    """
+    Merge the token rows of a sentence with those of its annotation layer: ID to XPOS are taken from the layer
+    where the base row has '_', FEATS items are merged and HEAD onwards always come from the base.
+    """
+    merged = []
+    for base, layer in zip(base_rows, layer_rows):
+        row = list(base)
+        row.extend("_" for _ in range(len(layer) - len(row)))
+        for col in range(min(FEATS, len(layer))):
+            if row[col] == "_":
+                row[col] = layer[col]
+        if len(layer) > FEATS:
+            row[FEATS] = merge_feats(row[FEATS], layer[FEATS])
+        merged.append(row)
+    return merged
+
+
+def _read_span(f, start, end):
+    f.seek(start)
+    return next(iter_sentences(f.read(end - start).decode("utf-8").splitlines()))
+
+
+def join_layers(base_file, layer_file, output_file):
+    """
+    Add the annotation layer of layer_file (e.g. */annotated/*_annotated.conll: lemmas, POS, Morph and tf
+    features) to the sentences of base_file (e.g. the gold file with HEAD/DEPREL), written to output_file.
+
+    A streaming hash-join: only a fingerprint -> byte ranges table of the layer file is kept in memory, the base
+    file is streamed and every matching layer sentence is read back by seeking. Sentences with the same
+    fingerprint are matched in file order. Unmatched base sentences are written unchanged. Returns a report with
+    the number of sentences, the matched ones and the unmatched sentence numbers of both files.
+    """
+    layer_index = {}
+    for start, end, sentence in read_sentence_spans(layer_file):
+        layer_index.setdefault(layer_fingerprint(sentence), []).append((start, end, sentence.index))
+
+    total = 0
+    matched = 0
+    unmatched = []
+    with open_random_access(layer_file) as layer, open_file(output_file, "w") as f_out:
+        for _, _, sentence in read_sentence_spans(base_file):
+            total += 1
+            spans = layer_index.get(layer_fingerprint(sentence))
+            if spans:
+                start, end, _ = spans.pop(0)
+                sentence.rows = merge_rows(sentence.rows, _read_span(layer, start, end).rows)
+                matched += 1
+            else:
+                unmatched.append(sentence.index)
+            write_sentence(f_out, sentence)
+
+    unused = sorted(index for spans in layer_index.values() for _, _, index in spans)
+    return {"sentences": total, "matched": matched, "unmatched": unmatched, "unused_layer": unused}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Merge an annotation layer (lemmas, POS, Morph, tf) into a "
+                                                    "CoNLL file such as a gold file.")
+    argparser.add_argument("base_file", type=str)
+    argparser.add_argument("layer_file", type=str)
+    argparser.add_argument("output_file", type=str)
+    args = argparser.parse_args()
+
+    report = join_layers(args.base_file, args.layer_file, args.output_file)
+    print(f"Matched {report['matched']} of {report['sentences']} sentences")
+    if report["unmatched"]:
+        print(f"{len(report['unmatched'])} sentences have no annotation (sentences "
+              f"{', '.join(map(str, report['unmatched']))})")
+    if report["unused_layer"]:
+        print(f"{len(report['unused_layer'])} annotated sentences were not used (sentences "
+              f"{', '.join(map(str, report['unused_layer']))})")
@@ -0,0 +1,235 @@
+import argparse
+import os
+
+import numpy as np
+
+from corpus_cache import load_corpus, load_derived
+from encoded_corpus import NO_VALUE
+from evaluate import sentence_correct
+
+# The canonical word order and props of the sentence every minimal pair family derives from
+BASE_ORDER = "VF[S]LK[V]MF[O]"
+BASE_PROPS = "base-acc"
+# How a sentence differs from the base of its family
+DIMENSIONS = ["base", "order", "props", "order+props", "unlinked"]
+BASE, ORDER, PROPS, ORDER_PROPS, UNLINKED = range(len(DIMENSIONS))
+# Word prefix length for the second matching pass, which tolerates inflection (Passantin/Passanten)
+PREFIX_LENGTH = 4
+HEADER = ["Dimension", "Class", "Pairs", "Both", "Base only", "Variant only", "Neither"]
+
+
+def _lexical_triples(corpus):
+    """Return the lowercased (subject, verb, object) forms of every sentence; the verb is the subject's head."""
+    words = [form.lower() for form in corpus.form_vocab.items]
+    token_sentences = corpus.token_sentences().tolist()
+    starts = corpus.sent_offsets[:-1].tolist()
+    lengths = corpus.sentence_lengths().tolist()
+    heads = corpus.heads
+    subjects = [None] * corpus.n_sentences
+    verbs = [None] * corpus.n_sentences
+    objects = [None] * corpus.n_sentences
+    for token in np.flatnonzero(corpus.deprel_mask("nsubj")).tolist():
+        sentence = token_sentences[token]
+        subjects[sentence] = words[corpus.form_codes[token]]
+        head = int(heads[token])
+        if 0 < head <= lengths[sentence]:
+            verbs[sentence] = words[corpus.form_codes[starts[sentence] + head - 1]]
+    for token in np.flatnonzero(corpus.deprel_mask("obj")).tolist():
+        objects[token_sentences[token]] = words[corpus.form_codes[token]]
+    return list(zip(subjects, verbs, objects))
+
+
+def _partial_keys(triple):
+    """Yield the (normalization, pair) keys of all pairs of known words of a triple, exact words first."""
+    for prefix in (None, PREFIX_LENGTH):
+        words = [w if w is None or prefix is None else w[:prefix] for w in triple]
+        for a, b in ((0, 1), (1, 2), (0, 2)):
+            if words[a] is not None and words[b] is not None:
+                yield prefix, a, b, words[a], words[b]
+
+
+def _csr(keys):
+    """Group sentences by an integer key: return (group of every sentence, members sorted by group, offsets)."""
+    _, groups = np.unique(keys, return_inverse=True)
+    groups = groups.astype(np.int32)
+    members = np.argsort(groups, kind="stable").astype(np.int32)
+    offsets = np.zeros(groups.max() + 2 if len(groups) else 1, dtype=np.int32)
+    np.cumsum(np.bincount(groups), out=offsets[1:])
+    return groups, members, offsets
+
+
+def build_pair_arrays(corpus):
+    """
+    Link every sentence to the base sentence of its minimal pair family.
+
+    Sentences with the same subject, verb and object forms (all word orders of a props variant, and e.g. base-aux
+    next to base-acc) form a group. Groups are then attached to families in the order base-acc groups, other base-*
+    groups, all other groups: a group joins the family with which it shares two of its three words, first
+    exactly and then by PREFIX_LENGTH-letter prefixes. Pairs of words shared by several families (e.g. two
+    pronouns) are ignored. Groups that match no family found their own; only those rooted in a base-* group
+    have a base sentence (the BASE_ORDER sentence of the root group).
+    """
+    n = corpus.n_sentences
+    props_items = corpus.props_vocab.items
+    props = [props_items[code] if code != NO_VALUE else "" for code in corpus.props_codes.tolist()]
+    orders = corpus.order_codes
+    base_order = corpus.order_vocab.code(BASE_ORDER) if BASE_ORDER in corpus.order_vocab.items else NO_VALUE
+
+    groups = {}
+    for sentence, triple in enumerate(_lexical_triples(corpus)):
+        groups.setdefault(triple, []).append(sentence)
+
+    def rank(item):
+        group_props = {props[s] for s in item[1]}
+        return 0 if BASE_PROPS in group_props else 1 if any(p.startswith("base-") for p in group_props) else 2
+
+    family = np.full(n, NO_VALUE, dtype=np.int32)
+    base = np.full(n, NO_VALUE, dtype=np.int32)
+    families_by_key = {}
+    family_bases = []
+    for triple, members in sorted(groups.items(), key=lambda item: (rank(item), item[1][0])):
+        found = None
+        for key in _partial_keys(triple):
+            candidates = families_by_key.get(key)
+            if candidates is not None and len(candidates) == 1:
+                found = next(iter(candidates))
+                break
+
+        if found is None:
+            found = len(family_bases)
+            root_props = [props[s] for s in members]
+            if BASE_PROPS in root_props or any(p.startswith("base-") for p in root_props):
+                wanted = BASE_PROPS if BASE_PROPS in root_props else next(p for p in root_props if p.startswith("base-"))
+                candidates = [s for s in members if props[s] == wanted]
+                root = next((s for s in candidates if orders[s] == base_order), candidates[0])
+            else:
+                root = NO_VALUE
+            family_bases.append(root)
+
+        family[members] = found
+        base[members] = family_bases[found]
+        for key in _partial_keys(triple):
+            families_by_key.setdefault(key, set()).add(found)
+
+    linked = base != NO_VALUE
+    same_order = linked & (orders == orders[np.where(linked, base, 0)])
+    same_props = linked & (corpus.props_codes == corpus.props_codes[np.where(linked, base, 0)])
+    dimension = np.full(n, UNLINKED, dtype=np.int8)
+    dimension[linked] = ORDER_PROPS
+    dimension[same_props & ~same_order] = ORDER
+    dimension[same_order & ~same_props] = PROPS
+    dimension[linked & same_order & same_props] = BASE
+
+    family64 = family.astype(np.int64)
+    _, family_members, family_offsets = _csr(family64)
+    order_groups, order_members, order_offsets = _csr(family64 * (len(props_items) + 1) + corpus.props_codes + 1)
+    props_groups, props_members, props_offsets = _csr(family64 * (len(corpus.order_vocab) + 1) + orders + 1)
+    return {
+        "family": family, "base": base, "dimension": dimension,
+        "family_members": family_members, "family_offsets": family_offsets,
+        "order_groups": order_groups, "order_members": order_members, "order_offsets": order_offsets,
+        "props_groups": props_groups, "props_members": props_members, "props_offsets": props_offsets,
+    }
+
+
+class PairIndex:
+    """
+    Minimal pair graph of a gold file: for every sentence (0-based) its family, the base sentence of the family
+    and its siblings that differ only in word order (same props) or only in props (same word order).
+    """
+
+    def __init__(self, arrays, corpus=None):
+        self.arrays = arrays
+        self.family = arrays["family"]
+        self.base_of = arrays["base"]
+        self.dimension = arrays["dimension"]
+        self.corpus = corpus
+
+    def base(self, sentence):
+        """Return the base sentence of a sentence, or None if its family has no base-* sentence."""
+        base = int(self.base_of[sentence])
+        return None if base == NO_VALUE else base
+
+    def _members(self, kind, group):
+        offsets = self.arrays[kind + "_offsets"]
+        return self.arrays[kind + "_members"][offsets[group]:offsets[group + 1]]
+
+    def family_members(self, sentence):
+        return self._members("family", self.family[sentence])
+
+    def order_siblings(self, sentence):
+        """Return the other sentences of the family with the same props, i.e. the other word orders."""
+        members = self._members("order", self.arrays["order_groups"][sentence])
+        return members[members != sentence]
+
+    def props_siblings(self, sentence):
+        """Return the other sentences of the family with the same word order, i.e. the other props variants."""
+        members = self._members("props", self.arrays["props_groups"][sentence])
+        return members[members != sentence]
+
+    def counts(self):
+        """Return the number of sentences per DIMENSIONS value and the number of families."""
+        counts = np.bincount(self.dimension, minlength=len(DIMENSIONS))
+        result = {name: int(count) for name, count in zip(DIMENSIONS, counts)}
+        result["families"] = len(self.arrays["family_offsets"]) - 1
+        return result
+
+
+def load_pair_index(filename, use_cache=True):
+    """Return the PairIndex of a gold file, built once and then reused from the cache next to the file."""
+    corpus, arrays = load_derived(filename, "pair_index", build_pair_arrays, use_cache)
+    return PairIndex(arrays, corpus)
+
+
+def pair_consistency(index, correct):
+    """
+    Compare the correctness (boolean array over sentences) of every linked variant with that of its base sentence.
+    Returns rows matching HEADER, per word order of the order variants and per props of the props variants.
+    """
+    corpus = index.corpus
+    rows = []
+    for dimension, codes, vocab in ((ORDER, corpus.order_codes, corpus.order_vocab),
+                                    (PROPS, corpus.props_codes, corpus.props_vocab)):
+        variants = np.flatnonzero(index.dimension == dimension)
+        base_ok = correct[index.base_of[variants]]
+        variant_ok = correct[variants]
+        classes = codes[variants]
+        # Outcome per pair: 0 both correct, 1 base only, 2 variant only, 3 neither
+        outcome = np.where(base_ok, 0, 2) + np.where(variant_ok, 0, 1)
+        table = np.zeros((len(vocab), 4), dtype=np.int64)
+        np.add.at(table, (classes, outcome), 1)
+        for code in np.flatnonzero(table.sum(axis=1)):
+            rows.append([DIMENSIONS[dimension], vocab.items[code], int(table[code].sum())] + table[code].tolist())
+    return rows
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Link every gold sentence to the base sentence of its minimal "
+                                                    "pair and compare systems on base/variant pairs.")
+    argparser.add_argument("gold_file", type=str)
+    argparser.add_argument("system_files", type=str, nargs="*")
+    argparser.add_argument("--sentence", type=int, default=None, help="Show the base and siblings of a sentence.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    index = load_pair_index(args.gold_file, not args.no_cache)
+    corpus = index.corpus
+
+    if args.sentence is not None:
+        sentence = args.sentence - 1
+        if not 0 <= sentence < corpus.n_sentences:
+            raise ValueError(f"Sentence must be between 1 and {corpus.n_sentences}")
+        base = index.base(sentence)
+        print(f"Sentence {args.sentence} ({DIMENSIONS[index.dimension[sentence]]}): {' '.join(corpus.forms(sentence))}")
+        print(f"Base: {'-' if base is None else f'{base + 1}: ' + ' '.join(corpus.forms(base))}")
+        for name, siblings in (("Order", index.order_siblings(sentence)), ("Props", index.props_siblings(sentence))):
+            for sibling in siblings:
+                print(f"{name} sibling {sibling + 1}: {' '.join(corpus.forms(sibling))}")
+    elif not args.system_files:
+        print("\t".join(f"{key}={value}" for key, value in index.counts().items()))
+    else:
+        print("\t".join(["System"] + HEADER))
+        for system_file in args.system_files:
+            correct = sentence_correct(corpus, load_corpus(system_file, not args.no_cache))
+            for row in pair_consistency(index, correct):
+                print("\t".join([os.path.basename(system_file)] + [str(v) for v in row]))
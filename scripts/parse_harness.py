@@ -0,0 +1,185 @@
+import argparse
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+from compressed_io import open_file
+from conll_reader import FEATS, FORM, ID, iter_sentences, read_sentences, write_sentence
+from join_layers import merge_feats
+
+N_COLUMNS = 10
+# Batches waiting between the stages; bounds the memory of the pipeline
+QUEUE_SIZE = 8
+_DONE = None
+
+
+def strip_sentence(sentence):
+    """Return the parser input for a gold sentence: only ID and FORM, all other columns '_'."""
+    return "".join(f"{cols[ID]}\t{cols[FORM]}" + "\t_" * (N_COLUMNS - 2) + "\n" for cols in sentence.rows) + "\n"
+
+
+def bucketed_batches(sentences, batch_size, bucket_width, max_lag=None):
+    """
+    Group (index, sentence) pairs into batches of batch_size sentences of similar length: sentences go to the
+    bucket of their length // bucket_width, and a full bucket is emitted as a batch. A partial bucket is emitted
+    once its first sentence is max_lag (default: 16 batches) sentences behind, which bounds the number of parses
+    waiting to be written in gold order. Remaining partial buckets are emitted at the end.
+    """
+    max_lag = max_lag or 16 * batch_size
+    buckets = {}
+    for index, sentence in sentences:
+        key = len(sentence) // bucket_width
+        bucket = buckets.setdefault(key, [])
+        bucket.append((index, sentence))
+        if len(bucket) == batch_size:
+            yield buckets.pop(key)
+        for key in [key for key, bucket in buckets.items() if index - bucket[0][0] >= max_lag]:
+            yield buckets.pop(key)
+    for bucket in buckets.values():
+        yield bucket
+
+
+def _put(q, item, stop):
+    """Put an item into a bounded queue unless the pipeline is stopped meanwhile; return whether it was put."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def merge_parse(gold, parsed):
+    """Return the parser's rows for a gold sentence, with the gold ID/FORM and the gold FEATS items added."""
+    if len(parsed.rows) != len(gold.rows):
+        raise ValueError(f"Parser returned {len(parsed.rows)} tokens for sentence {gold.index} "
+                         f"({len(gold.rows)} tokens)")
+    rows = []
+    for gold_cols, cols in zip(gold.rows, parsed.rows):
+        cols = cols[:N_COLUMNS] + ["_"] * (N_COLUMNS - len(cols))
+        cols[ID] = gold_cols[ID]
+        cols[FORM] = gold_cols[FORM]
+        if len(gold_cols) > FEATS:
+            cols[FEATS] = merge_feats(gold_cols[FEATS], cols[FEATS])
+        rows.append(cols)
+    gold.rows = rows
+    return gold
+
+
+def run_parser(command, gold_file, output_file, batch_size=64, bucket_width=4):
+    """
+    Parse all sentences of gold_file with an external parser command and write the parses, aligned with gold, to
+    output_file. The command reads CoNLL sentences (ID and FORM only) from stdin and writes one parsed CoNLL
+    sentence per input sentence, in input order, to stdout.
+
+    Three stages overlap: a thread reads gold and groups sentences into length-bucketed batches, a thread feeds
+    the batches to the parser, and the calling thread reads the parses, restores the gold order and writes them.
+    Returns a dict with the number of sentences and tokens and the elapsed seconds.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+                               bufsize=1 << 16)
+    batches = queue.Queue(QUEUE_SIZE)
+    in_flight = queue.Queue()
+    stop = threading.Event()
+    errors = []
+
+    def read_gold():
+        try:
+            for batch in bucketed_batches(enumerate(read_sentences(gold_file)), batch_size, bucket_width):
+                if not _put(batches, batch, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(batches, _DONE, stop)
+
+    def feed_parser():
+        try:
+            while not stop.is_set():
+                try:
+                    batch = batches.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if batch is _DONE:
+                    break
+                in_flight.put(batch)
+                process.stdin.write("".join(strip_sentence(sentence) for _, sentence in batch))
+                process.stdin.flush()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            in_flight.put(_DONE)
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=read_gold, daemon=True), threading.Thread(target=feed_parser, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    parses = iter_sentences(process.stdout)
+    waiting = {}
+    next_index = 0
+    tokens = 0
+    try:
+        with open_file(output_file, "w") as f_out:
+            while True:
+                batch = in_flight.get()
+                if batch is _DONE:
+                    break
+                for index, sentence in batch:
+                    parsed = next(parses, None)
+                    if parsed is None:
+                        raise ValueError(f"Parser output ended before sentence {sentence.index}")
+                    waiting[index] = merge_parse(sentence, parsed)
+                # Write all parses that are now contiguous in gold order
+                while next_index in waiting:
+                    sentence = waiting.pop(next_index)
+                    tokens += len(sentence)
+                    write_sentence(f_out, sentence)
+                    next_index += 1
+    except BaseException:
+        # Unblock the reading and feeding threads
+        stop.set()
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        if process.wait() != 0 and not errors:
+            errors.append(RuntimeError(f"Parser exited with code {process.returncode}"))
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    if waiting:
+        raise ValueError(f"Sentences {sorted(waiting)[:10]} could not be written in gold order")
+    return {"sentences": next_index, "tokens": tokens, "seconds": time.perf_counter() - start_time}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Parse a gold file with an external parser and write an "
+                                                    "aligned results file.")
+    argparser.add_argument("gold_file", type=str)
+    argparser.add_argument("output_file", type=str, help="e.g. dutch/results/dutch_amb_<parser>.conll")
+    argparser.add_argument("--parser", type=str, default=None,
+                           help="Parser command reading CoNLL on stdin and writing CoNLL to stdout "
+                                "(default: the stub parser).")
+    argparser.add_argument("--batch-size", type=int, default=64)
+    argparser.add_argument("--bucket-width", type=int, default=4, help="Sentence length range of a batch bucket.")
+    args = argparser.parse_args()
+
+    if args.parser:
+        command = shlex.split(args.parser)
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_parser.py")]
+    stats = run_parser(command, args.gold_file, args.output_file, args.batch_size, args.bucket_width)
+    print(f"Parsed {stats['sentences']} sentences ({stats['tokens']} tokens) in {stats['seconds']:.2f}s: "
+          f"{stats['sentences'] / stats['seconds']:.0f} sentences/s, {stats['tokens'] / stats['seconds']:.0f} tokens/s")
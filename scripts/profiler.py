@@ -0,0 +1,148 @@
+import json
+import resource
+import sys
+import time
+
+from compressed_io import strip_compression
+from conll_reader import FEATS_CACHES
+
+
+def peak_memory_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def profile_path(output_path):
+    """Return the path of the profile of a run writing output_path: <output_path>.profile.json"""
+    return strip_compression(output_path) + ".profile.json"
+
+
+def _hit_rate(counts):
+    lookups = counts["hits"] + counts["misses"]
+    return round(counts["hits"] / lookups, 4) if lookups else None
+
+
+class Profiler:
+    """
+    Wall time and call counts per named phase of a run, with the number of sentences and tokens processed.
+    Tools take an optional profiler and only wrap their functions with wrap/iterate when one is given, so that
+    runs without --profile execute the unwrapped code. Used as a context manager, it also times the values built on
+    the misses of every FEATS cache (conll_reader.FEATS_CACHES, e.g. parse_feats and the feats_facts of the checker)
+    as a phase named after the cache, and counts the hits, misses and evictions of each cache during the run.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.sentences = 0
+        self.tokens = 0
+        self.feats_cache = {}
+        self.seconds = 0.0
+        self._start = None
+        self._feats_start = None
+        self._feats_builds = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._feats_start = {name: cache.stats() for name, cache in FEATS_CACHES.items()}
+        self._feats_builds = {name: cache.build for name, cache in FEATS_CACHES.items()}
+        for name, cache in FEATS_CACHES.items():
+            cache.build = self.wrap(cache.build, name)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, build in self._feats_builds.items():
+            FEATS_CACHES[name].build = build
+        self.seconds += time.perf_counter() - self._start
+        for name, start in self._feats_start.items():
+            stats = FEATS_CACHES[name].stats()
+            self._add_feats_cache(name, {key: stats[key] - start[key] for key in ("hits", "misses", "evictions")})
+        return False
+
+    def _add_feats_cache(self, name, counts):
+        totals = self.feats_cache.setdefault(name, {})
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def _entry(self, name):
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0.0, 0]
+        return entry
+
+    def wrap(self, func, name):
+        """Return func timed as the phase name."""
+        entry = self._entry(name)
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry[0] += clock() - start
+                entry[1] += 1
+        return timed
+
+    def iterate(self, items, name, size=len):
+        """
+        Yield the items of an iterable, timing their production as the phase name and counting them as sentences
+        of size(item) tokens. With size None, the items (e.g. chunks of a file) are not counted.
+        """
+        entry = self._entry(name)
+        clock = time.perf_counter
+        iterator = iter(items)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                entry[0] += clock() - start
+                return
+            entry[0] += clock() - start
+            entry[1] += 1
+            if size is not None:
+                self.sentences += 1
+                self.tokens += size(item)
+            yield item
+
+    def merge(self, report):
+        """Add the phases, counts and FEATS cache counts of another profiler's report, e.g. of a pool worker."""
+        for name, phase in report["phases"].items():
+            entry = self._entry(name)
+            entry[0] += phase["seconds"]
+            entry[1] += phase["calls"]
+        self.sentences += report["sentences"]
+        self.tokens += report["tokens"]
+        for name, counts in report["feats_cache"].items():
+            self._add_feats_cache(name, {key: counts[key] for key in ("hits", "misses", "evictions")})
+
+    def report(self):
+        """Return the profile as a dict; phases are sorted by time, with their share of the wall time."""
+        seconds = self.seconds
+        report = {
+            "wall_seconds": round(seconds, 4),
+            "sentences": self.sentences,
+            "tokens": self.tokens,
+            "sentences_per_second": round(self.sentences / seconds, 1) if seconds else None,
+            "tokens_per_second": round(self.tokens / seconds, 1) if seconds else None,
+            "peak_memory_mb": round(peak_memory_mb(), 1),
+            "feats_cache": {name: dict(counts, hit_rate=_hit_rate(counts))
+                            for name, counts in self.feats_cache.items()},
+            "phases": {name: {"seconds": round(total, 4), "calls": calls,
+                              "share": round(total / seconds, 4) if seconds else None}
+                       for name, (total, calls) in sorted(self.phases.items(), key=lambda item: -item[1][0])},
+        }
+        children = peak_memory_mb(resource.RUSAGE_CHILDREN)
+        if children:
+            report["peak_children_memory_mb"] = round(children, 1)
+        return report
+
+    def write(self, path):
+        """Write the report as JSON to path (see profile_path); '-' prints it to stderr."""
+        text = json.dumps(self.report(), indent=2)
+        if path == "-":
+            print(text, file=sys.stderr)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
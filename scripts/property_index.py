@@ -0,0 +1,203 @@
+import argparse
+import re
+import sys
+
+import numpy as np
+
+from compressed_io import open_random_access
+from conll_reader import PROPERTIES, WORD_ORDERS
+from conll_view import FORMATS, convert_chunk, detect_format
+from corpus_cache import load_derived
+
+OPERATORS = {"AND", "OR", "NOT", "(", ")"}
+_TOKEN_RE = re.compile(r"\(|\)|[^\s()]+")
+# Sentences copied per output write with -o conll
+WRITE_BATCH = 1024
+
+
+class PropertyIndex:
+    """
+    Inverted index from word order values, props components (e.g. 'aux', 'amb') and full props values
+    (e.g. 'base-acc') to packed bitsets of sentence numbers.
+    Keys are namespaced as 'order:<value>', 'prop:<component>' and 'props:<value>'.
+    """
+
+    def __init__(self, keys, bitsets, n_sentences, corpus=None):
+        self.keys = list(keys)
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.bitsets = bitsets
+        self.n_sentences = n_sentences
+        self.corpus = corpus
+        self._all = np.packbits(np.ones(n_sentences, dtype=bool))
+
+    def lookup(self, term):
+        """Return the bitset of a query term. Bare terms are resolved as word order, props component or props value."""
+        if ":" in term:
+            candidates = [term]
+        else:
+            candidates = [f"order:{term}", f"prop:{term}", f"props:{term}"]
+        for key in candidates:
+            i = self.key_index.get(key)
+            if i is not None:
+                return self.bitsets[i]
+        # README classes that just do not occur in this file match nothing, with or without their namespace
+        namespace, _, value = term.rpartition(":")
+        if namespace in ("", "order") and value in WORD_ORDERS or \
+                namespace in ("", "prop", "props") and (value in PROPERTIES or value == "base"):
+            return np.zeros_like(self._all)
+        raise ValueError(f"Unknown query term: '{term}'")
+
+    def query(self, expression):
+        """Evaluate a boolean query such as 'MF[OS]VC[V] AND aux AND NOT dat' and return its bitset."""
+        parser = _QueryParser(_TOKEN_RE.findall(expression), self)
+        return parser.parse()
+
+    def sentence_ids(self, bitset):
+        """Return the (0-based) sentence numbers set in a bitset."""
+        return np.flatnonzero(np.unpackbits(bitset, count=self.n_sentences))
+
+    def count(self, bitset):
+        return int(np.unpackbits(bitset, count=self.n_sentences).sum())
+
+
+class _QueryParser:
+    """Recursive descent parser for queries: OR binds weaker than AND, which binds weaker than NOT."""
+
+    def __init__(self, tokens, index):
+        self.tokens = tokens
+        self.pos = 0
+        self.index = index
+
+    def peek(self):
+        return self.tokens[self.pos].upper() if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty query")
+        result = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in query")
+        return result
+
+    def parse_or(self):
+        result = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            result = np.bitwise_or(result, self.parse_and())
+        return result
+
+    def parse_and(self):
+        result = self.parse_not()
+        while self.peek() == "AND":
+            self.take()
+            result = np.bitwise_and(result, self.parse_not())
+        return result
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            # Mask the padding bits of the last byte
+            return np.bitwise_and(np.invert(self.parse_not()), self.index._all)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of query")
+        if token == "(":
+            self.take()
+            result = self.parse_or()
+            if self.peek() != ")":
+                raise ValueError("Missing ')' in query")
+            self.take()
+            return result
+        if token in OPERATORS:
+            raise ValueError(f"Unexpected '{self.take()}' in query")
+        return self.index.lookup(self.take())
+
+
+def build_index_arrays(corpus):
+    """Compute the keys and packed bitsets of a PropertyIndex from an EncodedCorpus."""
+    keys = []
+    masks = []
+
+    for code, order in enumerate(corpus.order_vocab.items):
+        keys.append(f"order:{order}")
+        masks.append(corpus.order_codes == code)
+
+    components = sorted({part for parts in corpus.props_components() for part in parts})
+    props_matrix = corpus.props_matrix(components)
+    component_masks = props_matrix[corpus.props_codes]
+    for i, component in enumerate(components):
+        keys.append(f"prop:{component}")
+        masks.append(component_masks[:, i])
+
+    for code, props in enumerate(corpus.props_vocab.items):
+        keys.append(f"props:{props}")
+        masks.append(corpus.props_codes == code)
+
+    if masks:
+        bitsets = np.packbits(np.vstack(masks), axis=1)
+    else:
+        bitsets = np.zeros((0, (corpus.n_sentences + 7) // 8), dtype=np.uint8)
+    return {"keys": np.array(keys, dtype=str), "bitsets": bitsets}
+
+
+def load_index(filename, use_cache=True):
+    """Return the PropertyIndex of a CoNLL file, built once and then reused from the corpus cache."""
+    corpus, arrays = load_derived(filename, "property_index", build_index_arrays, use_cache)
+    return PropertyIndex(arrays["keys"].tolist(), arrays["bitsets"], corpus.n_sentences, corpus)
+
+
+def write_sentences(corpus, sentence_ids, f_out, as_format=None):
+    """
+    Copy the given sentences from the source file to a binary output stream, seeking to each sentence.
+    With as_format ('conll' or 'conllu'), the FEATS separators are rewritten batch-wise on the way out.
+    """
+    convert = as_format is not None and detect_format(corpus.path) != as_format
+    lengths = corpus.sentence_lengths()
+    sentence_ids = [int(sentence) for sentence in sentence_ids]
+    starts = [int(corpus.token_offsets[corpus.sent_offsets[sentence]]) for sentence in sentence_ids]
+    batch = []
+    with open_random_access(corpus.path, starts) as f_in:
+        for n, (sentence, start) in enumerate(zip(sentence_ids, starts), 1):
+            f_in.seek(start)
+            for _ in range(int(lengths[sentence])):
+                batch.append(f_in.readline().rstrip(b"\r\n") + b"\n")
+            batch.append(b"\n")
+            if n % WRITE_BATCH == 0:
+                _flush(batch, f_out, as_format if convert else None)
+        _flush(batch, f_out, as_format if convert else None)
+
+
+def _flush(batch, f_out, as_format):
+    data = b"".join(batch)
+    f_out.write(convert_chunk(data, as_format) if as_format else data)
+    batch.clear()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Query sentences by word order and property annotations.")
+    argparser.add_argument("conll_file", type=str)
+    argparser.add_argument("query", type=str, help="e.g. 'MF[OS]VC[V] AND aux AND NOT dat'")
+    argparser.add_argument("--output", "-o", choices=["ids", "count", "conll"], default="ids",
+                           help="Print 1-based sentence numbers, their count or the sentences themselves.")
+    argparser.add_argument("--as", dest="as_format", choices=FORMATS, default=None,
+                           help="Write -o conll output as CoNLL-X or CoNLL-U regardless of the source format.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    index = load_index(args.conll_file, not args.no_cache)
+    bitset = index.query(args.query)
+
+    if args.output == "count":
+        print(index.count(bitset))
+    elif args.output == "conll":
+        write_sentences(index.corpus, index.sentence_ids(bitset), sys.stdout.buffer, args.as_format)
+    else:
+        sys.stdout.write("".join(f"{i + 1}\n" for i in index.sentence_ids(bitset)))
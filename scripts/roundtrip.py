@@ -0,0 +1,190 @@
+import argparse
+import csv
+import glob
+import multiprocessing
+import os
+
+from compressed_io import open_file
+from conll_reader import Sentence
+from conll_view import CONLLU, CONLLX, convert_chunk
+from conversions import TSV_HEADER, conll_to_tsv_row, tsv_row_to_conll
+from tsv_to_conll import guess_language
+
+COLUMN_NAMES = ["ID", "FORM", "LEMMA", "UPOS", "XPOS", "FEATS", "HEAD", "DEPREL", "DEPS", "MISC"]
+# Conversions checked against the stored counterpart: tsv2conll, conll2conllu, back to CoNLL-X and conll2tsv
+DIRECTIONS = ["tsv>conll", "tsv>conllu", "conll>conllu", "conllu>conll", "conll>tsv"]
+
+
+def find_suites(directories):
+    """Return (name, tsv, conll, conllu) paths of every *_gold.tsv suite; a missing CoNLL(-U) file is None."""
+    suites = []
+    for directory in directories:
+        for tsv_file in sorted(glob.glob(os.path.join(directory, "*_gold.tsv"))):
+            base = tsv_file[:-len(".tsv")]
+            conll = base + ".conll" if os.path.exists(base + ".conll") else None
+            conllu = base + "_u.conll" if os.path.exists(base + "_u.conll") else None
+            suites.append((os.path.basename(base), tsv_file, conll, conllu))
+    return suites
+
+
+def read_blocks(path):
+    """Return the token lines (without terminators) of every sentence of a CoNLL file, skipping comment lines."""
+    blocks = []
+    lines = []
+    with open_file(path) as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                if lines:
+                    blocks.append(lines)
+                lines = []
+            elif not line.startswith("#"):
+                lines.append(line)
+    if lines:
+        blocks.append(lines)
+    return blocks
+
+
+def read_tsv_rows(path):
+    with open_file(path) as f:
+        return list(csv.DictReader(f, delimiter="\t"))
+
+
+def first_difference(stored, converted, names):
+    """
+    Return (token, field, stored value, converted value) of the first field in which two sentences differ, or None.
+    Sentences are lists of tab-separated lines; token is None for a difference in the number of lines.
+    """
+    if len(stored) != len(converted):
+        return None, "tokens", str(len(stored)), str(len(converted))
+    for token, (stored_line, converted_line) in enumerate(zip(stored, converted), 1):
+        if stored_line == converted_line:
+            continue
+        stored_fields = stored_line.split("\t")
+        converted_fields = converted_line.split("\t")
+        for i in range(max(len(stored_fields), len(converted_fields))):
+            a = stored_fields[i] if i < len(stored_fields) else None
+            b = converted_fields[i] if i < len(converted_fields) else None
+            if a != b:
+                return token, names[i] if i < len(names) else f"column {i + 1}", a, b
+    return None
+
+
+def _tsv_line(row):
+    return "\t".join("" if value is None else str(value) for value in row)
+
+
+def verify_chunk(task):
+    """
+    Round-trip the sentences of one chunk of a suite and compare every conversion with the stored counterpart.
+    Returns {direction: (number of differing sentences, first difference)}, with the first difference as
+    (sentence number, token, field, stored value, converted value).
+    """
+    language, start, rows, conll_blocks, conllu_blocks, has_conll, has_conllu = task
+    metadata_cache = {}
+    result = {}
+
+    def record(direction, sentence, difference):
+        if difference is not None:
+            count, first = result.get(direction, (0, None))
+            result[direction] = (count + 1, first or (sentence,) + difference)
+
+    for i in range(max(len(rows), len(conll_blocks), len(conllu_blocks))):
+        sentence = start + i + 1
+        row = rows[i] if i < len(rows) else None
+        conll = conll_blocks[i] if i < len(conll_blocks) else None
+        conllu = conllu_blocks[i] if i < len(conllu_blocks) else None
+        # Sentences beyond the end of one of the files
+        for direction, source, stored, exists in (("tsv>conll", row, conll, has_conll),
+                                                  ("tsv>conllu", row, conllu, has_conllu),
+                                                  ("conll>conllu", conll, conllu, has_conll and has_conllu),
+                                                  ("conllu>conll", conllu, conll, has_conll and has_conllu),
+                                                  ("conll>tsv", conll, row, has_conll)):
+            if exists and (source is None) != (stored is None):
+                record(direction, sentence, (None, "sentence", "present" if stored else "missing",
+                                             "present" if source else "missing"))
+
+        if row is not None:
+            try:
+                converted = [[line.rstrip("\n") for line in lines]
+                             for lines in tsv_row_to_conll(row, (":", "="), language, metadata_cache)]
+            except (ValueError, TypeError, IndexError) as e:
+                record("tsv>conll", sentence, (None, "conversion", "", str(e)))
+                converted = None
+            if converted is not None:
+                for direction, stored, lines in (("tsv>conll", conll, converted[0]),
+                                                 ("tsv>conllu", conllu, converted[1])):
+                    if stored is not None:
+                        record(direction, sentence, first_difference(stored, lines, COLUMN_NAMES))
+        if conll is not None and conllu is not None:
+            for direction, source, stored, to_format in (("conll>conllu", conll, conllu, CONLLU),
+                                                         ("conllu>conll", conllu, conll, CONLLX)):
+                data = ("\n".join(source) + "\n").encode("utf-8")
+                lines = convert_chunk(data, to_format).decode("utf-8").rstrip("\n").split("\n")
+                record(direction, sentence, first_difference(stored, lines, COLUMN_NAMES))
+        if conll is not None and row is not None:
+            converted = _tsv_line(conll_to_tsv_row(Sentence(sentence, [line.split("\t") for line in conll])))
+            stored = _tsv_line(row.get(name) for name in TSV_HEADER)
+            record("conll>tsv", sentence, first_difference([stored], [converted], TSV_HEADER))
+    return result
+
+
+def verify_suites(suites, jobs=None, chunk_size=1000):
+    """
+    Verify that the TSV, CoNLL and CoNLL-U files of every suite agree, converting chunks of chunk_size sentences on
+    a process pool. Returns (name, direction, sentences, differing sentences, first difference) rows in suite and
+    DIRECTIONS order; first difference as returned by verify_chunk, for the first differing sentence of the file.
+    """
+    tasks = []
+    totals = []
+    for name, tsv_file, conll_file, conllu_file in suites:
+        rows = read_tsv_rows(tsv_file)
+        conll_blocks = read_blocks(conll_file) if conll_file else []
+        conllu_blocks = read_blocks(conllu_file) if conllu_file else []
+        n = max(len(rows), len(conll_blocks), len(conllu_blocks))
+        totals.append((name, n, bool(conll_file), bool(conllu_file)))
+        language = guess_language(tsv_file)
+        tasks.extend((name, (language, start, rows[start:start + chunk_size], conll_blocks[start:start + chunk_size],
+                             conllu_blocks[start:start + chunk_size], bool(conll_file), bool(conllu_file)))
+                     for start in range(0, n, chunk_size))
+
+    merged = {}
+    with multiprocessing.Pool(jobs) as pool:
+        for (name, _), result in zip(tasks, pool.imap(verify_chunk, [task for _, task in tasks])):
+            for direction, (count, first) in result.items():
+                total, earliest = merged.get((name, direction), (0, None))
+                merged[(name, direction)] = (total + count, earliest or first)
+
+    report = []
+    for name, n, has_conll, has_conllu in totals:
+        available = {"tsv>conll": has_conll, "tsv>conllu": has_conllu, "conll>conllu": has_conll and has_conllu,
+                     "conllu>conll": has_conll and has_conllu, "conll>tsv": has_conll}
+        for direction in DIRECTIONS:
+            if available[direction]:
+                count, first = merged.get((name, direction), (0, None))
+                report.append((name, direction, n, count, first))
+    return report
+
+
+def format_report_row(name, direction, n, count, first):
+    if not count:
+        return f"{name}\t{direction}\tOK\t{n} sentences"
+    sentence, token, field, stored, converted = first
+    where = f"sentence {sentence}" + (f" token {token}" if token is not None else "")
+    return (f"{name}\t{direction}\tDIFF\t{count} of {n} sentences; first: {where} {field}: "
+            f"stored '{stored}', converted '{converted}'")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Check that the TSV, CoNLL and CoNLL-U gold files still convert "
+                                                    "into each other.")
+    argparser.add_argument("directories", type=str, nargs="+", help="Gold folders, e.g. german/gold dutch/gold.")
+    argparser.add_argument("--jobs", "-j", type=int, default=None, help="Number of worker processes.")
+    argparser.add_argument("--chunk-size", type=int, default=1000, help="Sentences per parallel task.")
+    args = argparser.parse_args()
+
+    report = verify_suites(find_suites(args.directories), args.jobs, args.chunk_size)
+    for row in report:
+        print(format_report_row(*row))
+    if any(count for _, _, _, count, _ in report):
+        raise SystemExit(1)
@@ -0,0 +1,41 @@
+import argparse
+import sys
+
+from conll_reader import FORM, ID, iter_sentences
+
+# Stand-in for a real parser in parse_harness.py: reads CoNLL sentences from stdin and writes a trivial analysis
+# (first token subject, second token verb, last non-punctuation token object) to stdout, one sentence at a time.
+# --fail-after and --drop-token make it misbehave, to check how the harness reports parser failures.
+PUNCTUATION = frozenset({".", "?", "!", ","})
+
+
+def parse(rows):
+    words = [i for i, cols in enumerate(rows) if cols[FORM] not in PUNCTUATION]
+    verb = words[1] if len(words) > 1 else 0
+    heads = {i: (verb + 1, "punct") for i in range(len(rows))}
+    heads[verb] = (0, "root")
+    if words and words[0] != verb:
+        heads[words[0]] = (verb + 1, "nsubj")
+    if words and words[-1] != verb:
+        heads[words[-1]] = (verb + 1, "obj")
+    return [[cols[ID], cols[FORM], "_", "_", "_", "_", str(heads[i][0]), heads[i][1], "_", "_"]
+            for i, cols in enumerate(rows)]
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Trivial CoNLL parser reading stdin and writing stdout.")
+    argparser.add_argument("--fail-after", type=int, default=None, metavar="N",
+                           help="Exit with code 1 after parsing N sentences.")
+    argparser.add_argument("--drop-token", type=int, default=None, metavar="N",
+                           help="Leave out the last token of the N-th (1-based) input sentence.")
+    args = argparser.parse_args()
+
+    for n, sentence in enumerate(iter_sentences(sys.stdin), 1):
+        if args.fail_after is not None and n > args.fail_after:
+            print(f"stub_parser: failing at sentence {n}", file=sys.stderr)
+            raise SystemExit(1)
+        rows = parse(sentence.rows)
+        if n == args.drop_token:
+            rows = rows[:-1]
+        sys.stdout.write("".join("\t".join(cols) + "\n" for cols in rows) + "\n")
+        sys.stdout.flush()
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import io
+import sys
+
+import numpy as np
+
+from compressed_io import open_file
+from conll_reader import Sentence
+from conll_view import CONLLU, CONLLX
+from conversions import TSV_HEADER, conll_to_tsv_row
+from encoded_corpus import NO_VALUE
+from pair_index import load_pair_index
+from property_index import load_index, write_sentences
+
+# Index namespaces a subset can be stratified by: word order, props component (e.g. 'amb') and full props value
+STRATA = ["order", "prop", "props"]
+TSV = "tsv"
+OUTPUT_FORMATS = [CONLLX, CONLLU, TSV]
+# Pair-preserving constraints: add the base sentence of every selected variant, or its whole minimal pair family
+KEEP_PAIRS = ["base", "family"]
+
+
+def stratify(index, keys, bitset):
+    """
+    Split the sentences of a bitset into the non-empty cells of the stratification keys (STRATA namespaces).
+    Returns (label, bitset) pairs; labels join the values of a cell with '/'. A sentence with several props
+    components is in several 'prop' cells.
+    """
+    cells = [((), bitset)]
+    for key in keys:
+        if key not in STRATA:
+            raise ValueError(f"Unknown stratification key: '{key}'. Available: {', '.join(STRATA)}")
+        values = [name.split(":", 1)[1] for name in index.keys if name.startswith(f"{key}:")]
+        cells = [(label + (value,), cell & index.lookup(f"{key}:{value}")) for label, cell in cells for value in values]
+        cells = [(label, cell) for label, cell in cells if cell.any()]
+    return [("/".join(label) or "all", cell) for label, cell in cells]
+
+
+def check_cell(index, keys, label):
+    """
+    Raise ValueError unless label names a cell of the stratification keys: one index or README value per key,
+    joined with '/' ('all' without keys). The cell may be empty.
+    """
+    values = label.split("/") if keys else [label]
+    if not keys and label != "all" or len(values) != max(len(keys), 1):
+        raise ValueError(f"Cell '{label}' does not have one value per stratification key ({'/'.join(keys) or 'all'})")
+    for key, value in zip(keys, values):
+        try:
+            index.lookup(f"{key}:{value}")
+        except ValueError:
+            raise ValueError(f"Unknown cell '{label}': no {key} '{value}'") from None
+
+
+def select_subset(index, keys=(), quota=None, seed=0, query=None, cell_quotas=None, pairs=None, pair_index=None):
+    """
+    Draw a stratified sample of the sentences of an indexed file: up to quota sentences (all if None) from every
+    cell of the stratification keys, restricted to the sentences matching query. cell_quotas overrides the quota of
+    single cells by label. Sentences already drawn for an overlapping cell count towards the quota of the next.
+    With pairs ('base' or 'family', needs the pair_index), the base sentences or families of the drawn sentences
+    are added afterwards, beyond the quotas.
+    Returns the sorted 0-based sentence numbers and a report of (cell, available, selected) rows.
+    """
+    cell_quotas = dict(cell_quotas or {})
+    rng = np.random.default_rng(seed)
+    bitset = index.query(query) if query else np.packbits(np.ones(index.n_sentences, dtype=bool))
+
+    selected = np.zeros(index.n_sentences, dtype=bool)
+    report = []
+    for label, cell in stratify(index, keys, bitset):
+        members = index.sentence_ids(cell)
+        limit = cell_quotas.pop(label, quota)
+        if limit is None or limit >= len(members):
+            selected[members] = True
+        else:
+            need = limit - int(selected[members].sum())
+            if need > 0:
+                candidates = members[~selected[members]]
+                selected[rng.choice(candidates, need, replace=False)] = True
+        report.append((label, len(members), int(selected[members].sum())))
+    # The remaining cells are empty in the file or after the query
+    for label in cell_quotas:
+        check_cell(index, keys, label)
+        report.append((label, 0, 0))
+
+    if pairs is not None:
+        if pairs not in KEEP_PAIRS:
+            raise ValueError(f"Unknown pair constraint: '{pairs}'. Available: {', '.join(KEEP_PAIRS)}")
+        drawn = np.flatnonzero(selected)
+        if pairs == "base":
+            bases = pair_index.base_of[drawn]
+            selected[bases[bases != NO_VALUE]] = True
+        else:
+            selected |= np.isin(pair_index.family, pair_index.family[drawn])
+        report.append((f"+{pairs}", int(selected.sum()) - len(drawn), int(selected.sum())))
+    return np.flatnonzero(selected), report
+
+
+def write_tsv(corpus, sentence_ids, f_out):
+    """Write sentences in the gold TSV layout, with the rows of conversions.conll_to_tsv_row (as conll2tsv)."""
+    offsets = corpus.sent_offsets
+    writer = csv.writer(f_out, delimiter="\t")
+    writer.writerow(TSV_HEADER)
+    for sentence in sentence_ids:
+        rows = corpus.raw_rows(int(offsets[sentence]), int(offsets[sentence + 1]))
+        writer.writerow(conll_to_tsv_row(Sentence(int(sentence) + 1, rows)))
+
+
+def write_subset(corpus, sentence_ids, f_out, output_format=CONLLX):
+    """Write the given sentences of an indexed file to a binary stream as CoNLL-X, CoNLL-U or TSV."""
+    if output_format == TSV:
+        text = io.TextIOWrapper(f_out, encoding="utf-8", newline="")
+        write_tsv(corpus, sentence_ids, text)
+        text.detach()
+    else:
+        write_sentences(corpus, sentence_ids, f_out, output_format)
+
+
+def _cell_quota(value):
+    label, _, quota = value.rpartition("=")
+    if not label:
+        raise argparse.ArgumentTypeError(f"Expected CELL=N, got '{value}'")
+    return label, int(quota)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Write a stratified sample of the sentences of a CoNLL file.")
+    argparser.add_argument("conll_file", type=str)
+    argparser.add_argument("--output", "-o", type=str, default=None)
+    argparser.add_argument("--format", choices=OUTPUT_FORMATS, default=CONLLX)
+    argparser.add_argument("--by", nargs="*", choices=STRATA, default=[], help="Stratification keys.")
+    argparser.add_argument("--quota", type=int, default=None, help="Sentences per cell (default: all).")
+    argparser.add_argument("--cell-quota", type=_cell_quota, action="append", default=[], metavar="CELL=N",
+                           help="Quota of one cell, e.g. 'LK[V]MF[SO]/aux-pp=10' with --by order props.")
+    argparser.add_argument("--query", type=str, default=None, help="Only sample sentences matching a property query, "
+                                                                   "e.g. 'amb AND NOT aux'.")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--keep-pairs", choices=KEEP_PAIRS, default=None,
+                           help="Add the base sentence or the whole minimal pair family of every sampled sentence.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    use_cache = not args.no_cache
+    index = load_index(args.conll_file, use_cache)
+    pair_index = load_pair_index(args.conll_file, use_cache) if args.keep_pairs else None
+    try:
+        sentence_ids, report = select_subset(index, args.by, args.quota, args.seed, args.query, args.cell_quota,
+                                             args.keep_pairs, pair_index)
+    except ValueError as e:
+        argparser.error(str(e))
+
+    if args.output:
+        with open_file(args.output, "wb") as f_out:
+            write_subset(index.corpus, sentence_ids, f_out, args.format)
+    else:
+        write_subset(index.corpus, sentence_ids, sys.stdout.buffer, args.format)
+        sys.stdout.buffer.flush()
+
+    for label, available, selected in report:
+        print(f"{label}\t{available}\t{selected}", file=sys.stderr)
+    print(f"Selected {len(sentence_ids)} of {index.n_sentences} sentences", file=sys.stderr)
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from compressed_io import open_file, strip_compression
+from conversions import tsv_row_to_conll
+from corpus_cache import load_corpus
+from encoded_corpus import encode_bytes
+from tsv_to_conll import guess_language
+
+EXPORT_VERSION = 1
+META_FILE = "meta.json"
+VOCAB_FILE = "vocab.npz"
+# Padding of the token matrices; masks tell the real tokens apart
+PAD = -1
+
+
+def load_suite(filename, use_cache=True):
+    """Return the EncodedCorpus of a gold CoNLL file, or of a gold TSV file converted in memory with tsv2conll."""
+    if not strip_compression(filename).endswith(".tsv"):
+        return load_corpus(filename, use_cache)
+    language = guess_language(filename)
+    metadata_cache = {}
+    lines = []
+    with open_file(filename) as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            lines.extend(tsv_row_to_conll(row, (":",), language, metadata_cache)[0])
+            lines.append("\n")
+    return encode_bytes("".join(lines).encode("utf-8"), path=filename)
+
+
+def _positions(corpus, mask):
+    """Return the (0-based) position in its sentence of the last token of every sentence selected by a token mask."""
+    positions = np.full(corpus.n_sentences, PAD, dtype=np.int32)
+    tokens = np.flatnonzero(mask)
+    sentences = corpus.token_sentences()[tokens]
+    positions[sentences] = tokens - corpus.sent_offsets[sentences]
+    return positions
+
+
+def sentence_arrays(corpus):
+    """
+    Return the per-sentence arrays of an export: lengths, subject/object/verb positions (the verb is the token with
+    HEAD 0), order and props codes and the props component matrix, plus the component names.
+    """
+    components = sorted({part for parts in corpus.props_components() for part in parts})
+    arrays = {
+        "length": corpus.sentence_lengths().astype(np.int32),
+        "subject": _positions(corpus, corpus.deprel_mask("nsubj")),
+        "object": _positions(corpus, corpus.deprel_mask("obj")),
+        "verb": _positions(corpus, corpus.heads == 0),
+        "order": np.asarray(corpus.order_codes, dtype=np.int32),
+        "props": np.asarray(corpus.props_codes, dtype=np.int32),
+        "components": corpus.props_matrix(components)[corpus.props_codes],
+    }
+    return arrays, components
+
+
+def _padded(corpus, sentences, width, values):
+    """Return a (sentences x width) matrix of a token array, padded with PAD."""
+    lengths = corpus.sentence_lengths()[sentences]
+    columns = np.arange(width)
+    mask = columns[None, :] < lengths[:, None]
+    matrix = np.full((len(sentences), width), PAD, dtype=np.int32)
+    matrix[mask] = values[(corpus.sent_offsets[sentences][:, None] + columns[None, :])[mask]]
+    return matrix, mask
+
+
+def export_tensors(filename, output_dir, bucket_width=4, use_cache=True):
+    """
+    Export a gold suite as length-bucketed .npz shards in output_dir, one per range of bucket_width sentence lengths.
+    Every shard holds, for its sentences in file order: the sentence numbers (0-based), token (form code), HEAD
+    (0-based position, PAD for the root) and DEPREL code matrices padded to the longest sentence of the shard, the
+    token mask and the arrays of sentence_arrays. vocab.npz holds the string tables of all codes, meta.json the list
+    of shards. Shards are stored uncompressed so that load_shard can memory-map them.
+    """
+    corpus = load_suite(filename, use_cache)
+    per_sentence, components = sentence_arrays(corpus)
+    lengths = per_sentence["length"]
+    heads = np.where(corpus.heads > 0, corpus.heads - 1, PAD).astype(np.int32)
+    buckets = np.maximum(lengths - 1, 0) // bucket_width
+
+    os.makedirs(output_dir, exist_ok=True)
+    shards = []
+    for bucket in np.unique(buckets):
+        sentences = np.flatnonzero(buckets == bucket).astype(np.int32)
+        width = int(lengths[sentences].max())
+        shard = {"sentence": sentences}
+        shard["tokens"], shard["mask"] = _padded(corpus, sentences, width, corpus.form_codes)
+        shard["heads"], _ = _padded(corpus, sentences, width, heads)
+        shard["deprels"], _ = _padded(corpus, sentences, width, corpus.deprel_codes)
+        shard.update({name: values[sentences] for name, values in per_sentence.items()})
+        name = f"length_{bucket * bucket_width + 1:03d}-{(bucket + 1) * bucket_width:03d}.npz"
+        np.savez(os.path.join(output_dir, name), **shard)
+        shards.append({"file": name, "sentences": len(sentences), "width": width})
+
+    np.savez(os.path.join(output_dir, VOCAB_FILE),
+             forms=np.array(corpus.form_vocab.items, dtype=str),
+             deprels=np.array(corpus.deprel_vocab.items, dtype=str),
+             orders=np.array(corpus.order_vocab.items, dtype=str),
+             props=np.array(corpus.props_vocab.items, dtype=str),
+             components=np.array(components, dtype=str))
+    meta = {"version": EXPORT_VERSION, "source": os.path.abspath(filename), "sentences": corpus.n_sentences,
+            "tokens": corpus.n_tokens, "bucket_width": bucket_width, "shards": shards}
+    with open(os.path.join(output_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_shard(path):
+    """Memory-map every array of an uncompressed .npz file (as written by np.savez) without reading it."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+            # The local file header: 30 bytes, then the file name and the extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else \
+                np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            name = info.filename[:-len(".npy")]
+            if shape == () or 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def load_export(directory):
+    """Return the meta data, the string tables and the memory-mapped shards of an export."""
+    with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != EXPORT_VERSION:
+        raise ValueError(f"{directory} was written by another version of tensor_export.py")
+    with np.load(os.path.join(directory, VOCAB_FILE)) as data:
+        vocab = {key: data[key] for key in data.files}
+    shards = [load_shard(os.path.join(directory, shard["file"])) for shard in meta["shards"]]
+    return meta, vocab, shards
+
+
+def iter_batches(shards, batch_size, seed=None):
+    """
+    Yield batches of at most batch_size sentences of the same shard as dicts of array views, so all sentences of a
+    batch have similar lengths. With a seed, the order of the batches is shuffled.
+    """
+    batches = [(i, start) for i, shard in enumerate(shards) for start in range(0, len(shard["sentence"]), batch_size)]
+    if seed is not None:
+        np.random.default_rng(seed).shuffle(batches)
+    for i, start in batches:
+        yield {name: values[start:start + batch_size] for name, values in shards[i].items()}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Export a gold suite as length-bucketed, memory-mappable "
+                                                    "arrays for model probing.")
+    argparser.add_argument("gold_file", type=str, help="A gold CoNLL or TSV file.")
+    argparser.add_argument("output_dir", type=str)
+    argparser.add_argument("--bucket-width", type=int, default=4, help="Sentence length range of a shard.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    meta = export_tensors(args.gold_file, args.output_dir, args.bucket_width, not args.no_cache)
+    for shard in meta["shards"]:
+        print(f"{shard['file']}\t{shard['sentences']} sentences\twidth {shard['width']}")
+    print(f"Exported {meta['sentences']} sentences ({meta['tokens']} tokens) to {args.output_dir}")
@@ -0,0 +1,95 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from corpus_cache import load_corpus
+from encoded_corpus import NO_VALUE
+
+ISSUES = ["no_root", "multiple_roots", "cycle", "disconnected", "invalid_head", "unattached"]
+
+
+def validate_trees(corpus, complete=False):
+    """
+    Check the dependency trees of all sentences of an EncodedCorpus at once and return a dict issue -> boolean
+    array over sentences (plus 'roots': the number of roots per sentence).
+
+    Every token is linked to its global parent index, with two virtual nodes: ROOT (HEAD 0) and DEAD (invalid or
+    missing HEAD). Repeated pointer doubling then finds the final ancestor of every token: ROOT for tokens
+    connected to the root, DEAD for tokens hanging off a broken attachment and a regular token for tokens on or
+    leading into a cycle. Tokens without a HEAD ('_', as in the gold files) are ignored unless complete is set.
+    """
+    n_tokens = corpus.n_tokens
+    root_node = n_tokens
+    dead_node = n_tokens + 1
+
+    lengths = corpus.sentence_lengths()
+    token_sentences = corpus.token_sentences()
+    starts = corpus.sent_offsets[:-1][token_sentences]
+    heads = np.asarray(corpus.heads, dtype=np.int64)
+
+    missing = heads == NO_VALUE
+    invalid = ~missing & ((heads < 0) | (heads > lengths[token_sentences]))
+    is_root = heads == 0
+
+    parent = np.full(n_tokens + 2, dead_node, dtype=np.int64)
+    parent[root_node] = root_node
+    attached = ~(missing | invalid | is_root)
+    parent[:n_tokens][attached] = starts[attached] + heads[attached] - 1
+    parent[:n_tokens][is_root] = root_node
+
+    ancestor = parent
+    max_length = int(lengths.max()) if len(lengths) else 0
+    for _ in range(max(1, int(np.ceil(np.log2(max_length + 1))) + 1)):
+        ancestor = ancestor[ancestor]
+    ancestor = ancestor[:n_tokens]
+
+    n_sentences = corpus.n_sentences
+
+    def per_sentence(mask):
+        return np.bincount(token_sentences, weights=mask, minlength=n_sentences).astype(np.int64)
+
+    roots = per_sentence(is_root)
+    results = {
+        "roots": roots,
+        "no_root": roots == 0,
+        "multiple_roots": roots > 1,
+        "cycle": per_sentence(ancestor < n_tokens) > 0,
+        "disconnected": per_sentence(~missing & ~invalid & (ancestor == dead_node)) > 0,
+        "invalid_head": per_sentence(invalid) > 0,
+        "unattached": per_sentence(missing) > 0 if complete else np.zeros(n_sentences, dtype=bool),
+    }
+    return results
+
+
+def summarize(results):
+    return {issue: int(results[issue].sum()) for issue in ISSUES}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Check cycles, roots and connectedness of dependency trees.")
+    argparser.add_argument("conll_files", type=str, nargs="+")
+    argparser.add_argument("--complete", action="store_true",
+                           help="Require a HEAD for every token (for *_all-heads and results files).")
+    argparser.add_argument("--details", action="store_true", help="List the issues of every affected sentence.")
+    argparser.add_argument("--no-cache", action="store_true", help="Do not read or write the binary corpus cache.")
+    args = argparser.parse_args()
+
+    print("\t".join(["File", "Sentences"] + ISSUES + ["Seconds"]))
+    for conll_file in args.conll_files:
+        start_time = time.perf_counter()
+        corpus = load_corpus(conll_file, not args.no_cache)
+        results = validate_trees(corpus, args.complete)
+        elapsed = time.perf_counter() - start_time
+
+        counts = summarize(results)
+        file_name = os.path.basename(conll_file)
+        print("\t".join([file_name, str(corpus.n_sentences)] + [str(counts[i]) for i in ISSUES] + [f"{elapsed:.3f}"]))
+
+        if args.details:
+            affected = np.flatnonzero(np.any([results[issue] for issue in ISSUES], axis=0))
+            for sentence in affected:
+                issues = [issue for issue in ISSUES if results[issue][sentence]]
+                print(f"[{file_name}] Sentence {sentence + 1} – {', '.join(issues)}: "
+                      f"{' '.join(corpus.forms(sentence))}")
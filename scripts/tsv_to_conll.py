@@ -1,92 +1,72 @@
 import argparse
-import csv
-
-
-def get_verb_pos(word_order, subj_pos, obj_pos, words, props):
-    has_aux = "aux" in props
-    last_word_idx = len(words) - 1  # penultimate token = last word
-
-    if has_aux:
-        if word_order in {
-            "VF[S]LK[V]MF[O]",
-            "VF[O]LK[V]MF[S]",
-            "VF[ADV]LK[V]MF[SO]",
-            "VF[ADV]LK[V]MF[OS]",
-            "LK[V]MF[SO]",
-            "LK[V]MF[OS]"
-        }:
-            return last_word_idx
-        elif word_order in {
-            "MF[SO]VC[V]",
-            "MF[OS]VC[V]"
-        }:
-            return last_word_idx - 1
-        else:
-            raise ValueError(f"Unknown word order pattern with aux: {word_order}")
-
-    # Non-aux cases
-    if word_order == "VF[S]LK[V]MF[O]":
-        return subj_pos + 1
-    elif word_order == "VF[O]LK[V]MF[S]":
-        return obj_pos + 1
-    elif word_order in ("VF[ADV]LK[V]MF[SO]", "VF[ADV]LK[V]MF[OS]"):
-        return 2
-    elif word_order in ("LK[V]MF[SO]", "LK[V]MF[OS]"):
-        return 1
-    elif word_order in ("MF[SO]VC[V]", "MF[OS]VC[V]"):
-        return last_word_idx
-    else:
-        raise ValueError(f"Unknown word order pattern: {word_order}")
-
-    # If SVO and subj in  (Günter, Bertolt), subject pos + 2 --> außer bei psy, dort OVS
-
-
-def tsv2conll(input_path, output_path, format="conll"):
-    if format not in {"conll", "conllu"}:
-        raise ValueError("format must be either 'conll' or 'conllu'")
-
-    with open(input_path, encoding='utf-8') as f_in, open(output_path, 'w', encoding='utf-8') as f_out:
-        reader = csv.DictReader(f_in, delimiter='\t')
-
-        for row in reader:
-            word_order = row['Word Order']
-            props = row['Other Properties']
-            subj_pos = int(row['Subject Position'])
-            obj_pos = int(row['Object Position'])
-            words = row['Sentence'].strip().split()
-
-            sep = "=" if format == "conllu" else ":"
-            metadata = f"order{sep}{word_order}|props{sep}{props}"
-
-            verb_pos = get_verb_pos(word_order, subj_pos, obj_pos, words, props)
-
-            for idx, word in enumerate(words):
-                token_id = idx + 1
-                head = "_"
-                dep = "_"
-
-                if token_id == verb_pos:
-                    head = "0"
-                    dep = "verb"
-                elif token_id == subj_pos:
-                    head = str(verb_pos)
-                    dep = "nsubj"
-                elif token_id == obj_pos:
-                    head = str(verb_pos)
-                    dep = "obj"
-
-                f_out.write(f"{token_id}\t{word}\t_\t_\t_\t{metadata}\t{head}\t{dep}\t_\t_\n")
-            f_out.write("\n")
+import glob
+import os
+
+from conll_view import CONLLU, FORMATS
+from conversions import tsv2conll, tsv2conll_multi
+from profiler import Profiler, profile_path
+
+
+def guess_language(path):
+    return "nl" if os.path.basename(path).startswith("dutch") else "de"
+
+
+def regenerate_gold(directories, output_dir=None, conllu=True, profile=False):
+    """
+    Regenerate the *_gold.conll and *_gold_u.conll files of the given gold folders from their tsv files.
+    Without conllu, only the CoNLL-X files are written; their CoNLL-U version can be streamed with conll_view.
+    With profile, the profile of every conversion is written next to its CoNLL-X file.
+    """
+    for directory in directories:
+        for tsv_file in sorted(glob.glob(os.path.join(directory, "*_gold.tsv"))):
+            basename = os.path.basename(tsv_file)[:-len(".tsv")]
+            target_dir = output_dir or directory
+            os.makedirs(target_dir, exist_ok=True)
+            outputs = {"conll": os.path.join(target_dir, basename + ".conll")}
+            if conllu:
+                outputs["conllu"] = os.path.join(target_dir, basename + "_u.conll")
+            if profile:
+                with Profiler() as profiler:
+                    tsv2conll_multi(tsv_file, outputs, guess_language(tsv_file), profiler=profiler)
+                profiler.write(profile_path(outputs["conll"]))
+            else:
+                tsv2conll_multi(tsv_file, outputs, guess_language(tsv_file))
+            print(f"{tsv_file} -> {', '.join(outputs.values())}")
 
 
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser()
-    argparser.add_argument("testsuite_file", type=str)
-    argparser.add_argument("conll_file", type=str)
+    argparser.add_argument("testsuite_file", type=str, nargs="?")
+    argparser.add_argument("conll_file", type=str, nargs="?")
     argparser.add_argument("--conll_type", "-t", default="x", choices=["x", "u"])
+    argparser.add_argument("--as", dest="as_format", choices=FORMATS, default=None,
+                           help="Output format, as for the other tools; overrides --conll_type.")
+    argparser.add_argument("--language", "-l", default=None, choices=["de", "nl"],
+                           help="Language of the test suite (default: guessed from the file name).")
+    argparser.add_argument("--gold", type=str, nargs="+", default=None, metavar="GOLD_DIR",
+                           help="Regenerate the CoNLL and CoNLL-U files of all *_gold.tsv files in these folders.")
+    argparser.add_argument("--no-conllu", action="store_true",
+                           help="With --gold, skip the *_u.conll copies (stream them with conll_view.py --as conllu).")
+    argparser.add_argument("--output-dir", type=str, default=None, help="Output folder for --gold.")
+    argparser.add_argument("--profile", action="store_true",
+                           help="Time reading, conversion and writing; written to <conll_file>.profile.json.")
     args = argparser.parse_args()
 
-    if args.conll_type == "u" and "_u" not in args.conll_file:
-        raise ValueError("A conll-U file must have '_u' as its basename ending.")
-
-    tsv2conll(args.testsuite_file, args.conll_file, args.conll_type)
+    if args.gold:
+        regenerate_gold(args.gold, args.output_dir, not args.no_conllu, args.profile)
+    else:
+        if args.testsuite_file is None or args.conll_file is None:
+            argparser.error("testsuite_file and conll_file are required without --gold")
+        if args.as_format is not None:
+            args.conll_type = "u" if args.as_format == CONLLU else "x"
+        if args.conll_type == "u" and "_u" not in args.conll_file:
+            raise ValueError("A conll-U file must have '_u' as its basename ending.")
+
+        language = args.language or guess_language(args.testsuite_file)
+        conll_format = "conllu" if args.conll_type == "u" else "conll"
+        if args.profile:
+            with Profiler() as profiler:
+                tsv2conll(args.testsuite_file, args.conll_file, conll_format, language, profiler)
+            profiler.write(profile_path(args.conll_file))
+        else:
+            tsv2conll(args.testsuite_file, args.conll_file, conll_format, language)